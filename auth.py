@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import deque
+
+import bcrypt
+
+import db
+
+BCRYPT_ROUNDS = int(os.environ.get("DDI_BCRYPT_ROUNDS", "12"))
+# Most bcrypt hashes computed at once, so a burst of logins cannot take every core
+HASH_WORKERS = int(os.environ.get("DDI_HASH_WORKERS", str(os.cpu_count() or 1)))
+MAX_LOGIN_FAILURES = int(os.environ.get("DDI_MAX_LOGIN_FAILURES", "5"))
+LOGIN_WINDOW = float(os.environ.get("DDI_LOGIN_WINDOW", "300"))
+# Most usernames the login throttle tracks at once
+MAX_TRACKED_LOGINS = int(os.environ.get("DDI_MAX_TRACKED_LOGINS", "100000"))
+
+# bcrypt releases the GIL, so script threads hash in parallel; this only caps
+# how many do so at once (the calling thread still waits for its hash)
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS)
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed logins; try again in {int(retry_after) + 1} seconds.")
+        self.retry_after = retry_after
+
+
+class LoginThrottle:
+    """
+    Sliding-window limit on failed logins per username. Once a username has
+    `max_failures` failures inside `window` seconds, further attempts are
+    rejected before any hashing is done. An attempt counts as a failure from
+    the moment it is admitted until it succeeds, so parallel attempts cannot
+    all slip past the limit. Usernames with no recent failures are swept
+    once per window, and at most `max_tracked` are kept.
+    """
+
+    def __init__(self, max_failures=MAX_LOGIN_FAILURES, window=LOGIN_WINDOW, max_tracked=MAX_TRACKED_LOGINS):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_tracked = max_tracked
+        self._failures = {}
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recent(self, username, now):
+        failures = self._failures.get(username)
+        if failures is None:
+            return None
+        while failures and now - failures[0] > self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[username]
+            return None
+        return failures
+
+    def _sweep(self, now):
+        if now - self._swept_at >= self.window:
+            self._swept_at = now
+            for username in list(self._failures):
+                self._recent(username, now)
+
+    # Admit a login attempt, counting it as a failure until record_success;
+    # raises LoginThrottled if the username is locked out
+    def begin_attempt(self, username):
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            failures = self._recent(username, now)
+            if failures and len(failures) >= self.max_failures:
+                raise LoginThrottled(self.window - (now - failures[0]))
+            self._failures.setdefault(username, deque()).append(now)
+            # Oldest usernames first (dicts keep insertion order)
+            while len(self._failures) > self.max_tracked:
+                del self._failures[next(iter(self._failures))]
+
+    def record_success(self, username):
+        with self._lock:
+            self._failures.pop(username, None)
+
+
+throttle = LoginThrottle()
+
+
+def hash_password(password):
+    with _hash_slots:
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
+
+
+def check_password(password, hashed_password):
+    with _hash_slots:
+        return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+# Add a new user to the database
+def add_user(username, password, height, weight, comorbidities, route, gender, substance_use):
+    db.add_user(username, hash_password(password), height, weight, comorbidities, route, gender, substance_use)
+
+
+# Verify user credentials; raises LoginThrottled while the username is locked out
+def verify_user(username, password):
+    throttle.begin_attempt(username)
+    hashed_password = db.get_password_hash(username)
+    if hashed_password is not None and check_password(password, hashed_password):
+        throttle.record_success(username)
+        return True
+    return False
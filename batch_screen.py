@@ -0,0 +1,180 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+import db
+from drug_names import get_default_names
+from interaction_cache import normalize_drug
+from interaction_prompt import PROMPT_VERSION
+from logging_config import configure_logging
+
+SCREEN_WORKERS = int(os.environ.get("DDI_SCREEN_WORKERS", str(os.cpu_count() or 1)))
+SCREEN_TIMEOUT = float(os.environ.get("DDI_PAIR_TIMEOUT", "30"))
+# Pairs between checkpoint flushes and progress reports
+CHECKPOINT_EVERY = int(os.environ.get("DDI_SCREEN_CHECKPOINT_EVERY", "500"))
+# Interaction rows per write transaction
+WRITE_BATCH = int(os.environ.get("DDI_SCREEN_WRITE_BATCH", "10000"))
+
+logger = logging.getLogger(__name__)
+
+
+def pair_key(drug1, drug2):
+    return tuple(sorted((normalize_drug(drug1), normalize_drug(drug2))))
+
+
+# Every user's drugs, collapsed to canonical names, as (username, [canonical
+# names]). Rows arrive grouped by user, so only one user's drugs are held at a time.
+def iter_user_drugs():
+    names = get_default_names()
+    current, drugs = None, []
+    for username, drug_name in db.iter_all_drugs():
+        if username != current:
+            if current is not None:
+                yield current, [drug for drug, _ in names.dedupe_drugs(drugs)]
+            current, drugs = username, []
+        drugs.append((drug_name, None))
+    if current is not None:
+        yield current, [drug for drug, _ in names.dedupe_drugs(drugs)]
+
+
+# The unique pairs across all users as {pair key: (drug1, drug2)}, the number
+# of users and the total number of per-user pairs. Users' drug lists are not
+# kept; write_results reads them again.
+def collect_pairs():
+    unique, users, total = {}, 0, 0
+    for _, canonical in iter_user_drugs():
+        users += 1
+        for i in range(len(canonical)):
+            for j in range(i + 1, len(canonical)):
+                unique.setdefault(pair_key(canonical[i], canonical[j]), (canonical[i], canonical[j]))
+        total += len(canonical) * (len(canonical) - 1) // 2
+    return unique, users, total
+
+
+# Verdicts already recorded for this prompt/model version
+def load_checkpoint(path):
+    verdicts = {}
+    if not os.path.exists(path):
+        return verdicts
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            if entry.get("model_version") == PROMPT_VERSION:
+                verdicts[pair_key(entry["drug1"], entry["drug2"])] = entry["verdict"]
+    return verdicts
+
+
+def _screen_pair(pair):
+    from interaction_checker import check_drug_interaction
+
+    drug1, drug2 = pair
+    try:
+        verdict, current = check_drug_interaction(drug1, None, drug2, None, None, timeout=SCREEN_TIMEOUT)
+        if not current:
+            # Answered by another model than PROMPT_VERSION names; left for a rerun
+            verdict = "0"
+    except (requests.RequestException, sqlite3.OperationalError) as e:
+        # A locked verdict cache fails this pair only; it is retried on the next run
+        logger.warning("Interaction check failed", extra={"drug1": drug1, "drug2": drug2, "error": str(e)})
+        verdict = "0"
+    return drug1, drug2, verdict
+
+
+# Evaluate `pairs` in a process pool, appending each real verdict to the
+# checkpoint file and adding it to `verdicts`
+def screen_pairs(pairs, verdicts, checkpoint_path, workers=SCREEN_WORKERS):
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+    # Workers import the client fresh, so they pick up DDI_MODEL_API_URL and DDI_REQUEST_PRIORITY as set now
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=configure_logging) as pool, open(checkpoint_path, "a") as f:
+        chunksize = max(1, min(64, len(pairs) // (workers * 8) or 1))
+        for done, (drug1, drug2, verdict) in enumerate(pool.map(_screen_pair, pairs, chunksize=chunksize), start=1):
+            if verdict in ("+1", "-1"):
+                verdicts[pair_key(drug1, drug2)] = verdict
+                f.write(json.dumps({"drug1": drug1, "drug2": drug2, "verdict": verdict, "model_version": PROMPT_VERSION}) + "\n")
+            if done % CHECKPOINT_EVERY == 0 or done == len(pairs):
+                f.flush()
+                os.fsync(f.fileno())
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed if elapsed else 0.0
+                eta = (len(pairs) - done) / rate if rate else 0.0
+                print(f"{done}/{len(pairs)} pairs, {rate:.1f} pairs/s, ETA {eta:.0f}s", flush=True)
+    return time.perf_counter() - start
+
+
+# Write every user's verdicts to the interactions table, many users per
+# transaction, reading the users' drugs again one user at a time
+def write_results(verdicts):
+    rows, written = [], 0
+    for username, canonical in iter_user_drugs():
+        for i in range(len(canonical)):
+            for j in range(i + 1, len(canonical)):
+                key = pair_key(canonical[i], canonical[j])
+                verdict = verdicts.get(key)
+                if verdict is not None:
+                    rows.append((username,) + key + (verdict, None))
+        if len(rows) >= WRITE_BATCH:
+            db.save_interactions(rows, PROMPT_VERSION)
+            written += len(rows)
+            rows = []
+    if rows:
+        db.save_interactions(rows, PROMPT_VERSION)
+        written += len(rows)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-screen every user's medication pairs with the current model.")
+    parser.add_argument("--db", default=db.DB_PATH, help="Users database")
+    parser.add_argument("--model-url", help="Model server to use instead of DDI_MODEL_API_URL")
+    parser.add_argument("--workers", type=int, default=SCREEN_WORKERS)
+    parser.add_argument(
+        "--checkpoint", default=os.path.join("data", f"screening_{PROMPT_VERSION}.jsonl"),
+        help="Verdicts recorded so far; an interrupted run resumes from it")
+    parser.add_argument("--fresh", action="store_true", help="Ignore any existing checkpoint")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.model_url:
+        os.environ["DDI_MODEL_API_URL"] = args.model_url
+    # Screening runs in the model server's batch lane, behind interactive checks
+    os.environ["DDI_REQUEST_PRIORITY"] = "batch"
+    # Workers' verdict caches live in the same database
+    os.environ["DDI_DB_PATH"] = db.DB_PATH = args.db
+    db.init_db()
+
+    start = time.perf_counter()
+    unique, users, total = collect_pairs()
+    print(f"{users} users, {total} user pairs, {len(unique)} unique pairs")
+
+    if args.fresh and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    verdicts = load_checkpoint(args.checkpoint)
+    pending = [pair for key, pair in unique.items() if key not in verdicts]
+    print(f"{len(unique) - len(pending)} pairs already in {args.checkpoint}, {len(pending)} to evaluate")
+
+    if pending:
+        elapsed = screen_pairs(pending, verdicts, args.checkpoint, args.workers)
+        print(f"Evaluated {len(pending)} pairs in {elapsed:.1f}s ({len(pending) / elapsed:.1f} pairs/s)")
+    failed = len(unique) - len(verdicts)
+    if failed:
+        print(f"{failed} pairs failed and will be retried on the next run")
+
+    written = write_results(verdicts)
+    print(f"Wrote {written} interaction rows in {time.perf_counter() - start:.1f}s total")
+
+
+if __name__ == "__main__":
+    main()
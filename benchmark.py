@@ -0,0 +1,474 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import db
+
+# Syllables for made-up drug names; digits would be dropped as strengths
+_SYLLABLES = ["ba", "cor", "dex", "fla", "gli", "lo", "mi", "nor", "pra", "qui", "ro", "sta", "ta", "vo", "xa", "zi"]
+_SUFFIXES = ["pril", "sartan", "statin", "olol", "azole", "mab", "cillin", "dronate", "tidine", "zepam"]
+
+
+def synthetic_drug_names(count, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 3))) + rng.choice(_SUFFIXES))
+    return sorted(names)
+
+
+# Draw drugs-per-user counts from "fixed:N", "uniform:A-B" or "poisson:MEAN"
+def drugs_per_user(spec, rng):
+    kind, _, value = spec.partition(":")
+    if kind == "fixed":
+        return lambda: int(value)
+    if kind == "uniform":
+        low, high = (int(part) for part in value.split("-"))
+        return lambda: rng.randint(low, high)
+    if kind == "poisson":
+        mean = float(value)
+
+        def poisson():
+            # Knuth's method; fine for the small means regimens have
+            limit, k, p = pow(2.718281828459045, -mean), 0, 1.0
+            while True:
+                p *= rng.random()
+                if p <= limit:
+                    return k
+                k += 1
+        return poisson
+    raise ValueError(f"Unknown distribution {spec!r}; use fixed:N, uniform:A-B or poisson:MEAN")
+
+
+# Write a users.db with `users` users whose regimens are drawn from
+# `distribution` over a vocabulary of `vocabulary` drug names
+def generate_users_db(path, users, distribution="poisson:6", vocabulary=500, seed=0):
+    rng = random.Random(seed)
+    names = synthetic_drug_names(vocabulary, seed)
+    draw = drugs_per_user(distribution, rng)
+    if os.path.exists(path):
+        os.remove(path)
+    db.init_db(path)
+    conn = db.get_connection(path)
+    drug_rows = 0
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (username, password, height, weight, comorbidities, route, gender, substance_use) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((f"user{u}", b"x", 170.0, 70.0, "", "Oral", "Other", "") for u in range(users)),
+        )
+        for u in range(users):
+            regimen = rng.sample(names, min(len(names), draw()))
+            conn.executemany(
+                "INSERT INTO drugs (username, drug_name, dosage, drug_id) VALUES (?, ?, ?, ?)",
+                ((f"user{u}", name, "10 mg", None) for name in regimen),
+            )
+            drug_rows += len(regimen)
+    return drug_rows
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# Call `fn` `iterations` times (after one warm-up call) and summarize the timings.
+# `items` is how many units one call handles, for the throughput figure.
+def measure(name, size, fn, iterations, items=1):
+    fn()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    total = sum(timings)
+    timings.sort()
+    result = {
+        "name": name,
+        "size": size,
+        "iterations": iterations,
+        "p50_ms": _percentile(timings, 0.50) * 1000,
+        "p95_ms": _percentile(timings, 0.95) * 1000,
+        "p99_ms": _percentile(timings, 0.99) * 1000,
+        "mean_ms": total / iterations * 1000,
+        "throughput": iterations * items / total if total else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print(f"{name:<28} size={size:<6} p50={result['p50_ms']:9.2f}ms p95={result['p95_ms']:9.2f}ms "
+          f"p99={result['p99_ms']:9.2f}ms {result['throughput'] or 0:10.1f}/s rss={result['peak_rss_mb']:.0f}MB")
+    return result
+
+
+# check_drug_compatibility against the model server for regimens of each size,
+# with the verdict cache cleared before every call so each pair hits the server
+def bench_compatibility(sizes, iterations):
+    from interaction_cache import get_default_cache
+    from interaction_checker import check_drug_compatibility
+
+    names = synthetic_drug_names(max(sizes))
+    patient_info = (170.0, 70.0, "", "Oral", "Other", "")
+    results = []
+    for size in sizes:
+        drugs = [(name, "10 mg") for name in names[:size]]
+
+        def run():
+            get_default_cache().clear()
+            check_drug_compatibility(drugs, patient_info)
+
+        results.append(measure("check_drug_compatibility", size, run, iterations, items=size * (size - 1) // 2))
+    return results
+
+
+# The db helpers on synthetic databases of each user count
+def bench_db(sizes, iterations, workdir, distribution):
+    results = []
+    for size in sizes:
+        path = os.path.join(workdir, f"users_{size}.db")
+        generate_users_db(path, size, distribution)
+        db.DB_PATH = path
+        rng = random.Random(size)
+        usernames = [f"user{rng.randrange(size)}" for _ in range(iterations + 1)]
+        picks = itertools.cycle(usernames)
+        counter = itertools.count()
+
+        results.append(measure("db.get_user_drugs", size, lambda: db.get_user_drugs(next(picks)), iterations))
+
+        # get_user_profile answers repeat lookups from memory; drop the entry
+        # first so the query itself is timed
+        def uncached_profile():
+            username = next(picks)
+            db._invalidate_profile(username)
+            return db.get_user_profile(username)
+
+        results.append(measure("db.get_user_profile", size, uncached_profile, iterations))
+        results.append(measure(
+            "db.add_drugs", size, lambda: db.add_drugs(next(picks), f"benchdrug{next(counter)}", "1 mg"), iterations))
+        results.append(measure(
+            "db.get_user_interactions", size, lambda: db.get_user_interactions(next(picks), "bench"), iterations))
+    return results
+
+
+# create_interaction_graph on complete graphs of each node count. Node names
+# change every call so the layout cache never hits.
+def bench_graph(sizes, iterations):
+    from interaction_graph import create_interaction_graph
+
+    severities = ["high", "moderate", "mild", "none"]
+    results = []
+    for size in sizes:
+        names = synthetic_drug_names(size)
+        counter = itertools.count()
+
+        def run():
+            tag = next(counter)
+            interactions = [
+                (f"{a}{tag}", f"{b}{tag}", {"severity": severities[(i + j) % 4], "description": "bench"})
+                for i, a in enumerate(names) for j, b in enumerate(names) if i < j
+            ]
+            create_interaction_graph(interactions)
+
+        results.append(measure("create_interaction_graph", size, run, iterations))
+    return results
+
+
+class _NotebookDrugEnv:
+    """The notebook's DrugInteractionEnv, kept as the baseline for bench_env."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.state_idx = 0
+
+    def reset(self):
+        self.state_idx = 0
+        return self._encode_state(self.dataset.iloc[self.state_idx])
+
+    def step(self, action):
+        state = self.dataset.iloc[self.state_idx]
+        reward = 1 if action == state["Y"] else -1
+        self.state_idx += 1
+        done = self.state_idx >= len(self.dataset)
+        next_state = self.dataset.iloc[self.state_idx] if not done else None
+        observation = self._encode_state(next_state) if next_state is not None else np.zeros(2)
+        return observation, reward, done, {}
+
+    def _encode_state(self, state):
+        drug1_index = self.dataset["Drug1"].unique().tolist().index(state["Drug1"])
+        drug2_index = self.dataset["Drug2"].unique().tolist().index(state["Drug2"])
+        return np.array([drug1_index, drug2_index], dtype=np.float32)
+
+
+# Environment steps per second on synthetic interaction tables of each row
+# count: the notebook's env one step at a time against VecDrugInteractionEnv
+# stepping `num_envs` sub-environments per call
+def bench_env(sizes, iterations, num_envs, steps=200):
+    import pandas as pd
+
+    from drug_env import VecDrugInteractionEnv, encode_interactions
+
+    results = []
+    for size in sizes:
+        rng = np.random.default_rng(size)
+        names = np.array(synthetic_drug_names(max(2, size // 100)))
+        frame = pd.DataFrame({
+            "Drug1": names[rng.integers(0, len(names), size)],
+            "Drug2": names[rng.integers(0, len(names), size)],
+            "Y": rng.integers(0, 2, size),
+        })
+        actions = rng.integers(0, 2, size=(steps, num_envs))
+
+        notebook_env = _NotebookDrugEnv(frame)
+        notebook_env.reset()
+
+        def run_notebook():
+            for step in range(steps):
+                if notebook_env.step(actions[step, 0])[2]:
+                    notebook_env.reset()
+
+        vec_env = VecDrugInteractionEnv(*encode_interactions(frame["Drug1"], frame["Drug2"], frame["Y"])[:2],
+                                        num_envs=num_envs, seed=0)
+        vec_env.reset()
+
+        def run_vec():
+            for step in range(steps):
+                vec_env.step(actions[step])
+
+        results.append(measure("notebook DrugInteractionEnv", size, run_notebook, iterations, items=steps))
+        results.append(measure(f"VecDrugInteractionEnv x{num_envs}", size, run_vec, iterations, items=steps * num_envs))
+    return results
+
+
+def start_stub_server(port, latency, jitter):
+    stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_model_server.py")
+    process = subprocess.Popen([sys.executable, stub, "--port", str(port), "--latency", str(latency),
+                                "--jitter", str(jitter)])
+    import requests
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Stub model server did not start")
+
+
+# Seconds for a fresh interpreter to import `module`
+def time_import(module):
+    root = os.path.dirname(os.path.abspath(__file__))
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=root, text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+# Start the model server and return the seconds until /healthz answers and,
+# if `wait_ready`, until /readyz does
+def time_server_start(port, model_path, wait_ready, timeout=300):
+    import requests
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    if model_path:
+        env["DDI_MODEL_PATH"] = model_path
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=root, env=env, stderr=subprocess.DEVNULL,
+    )
+    live = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            url = f"http://127.0.0.1:{port}/readyz" if live is not None else f"http://127.0.0.1:{port}/healthz"
+            try:
+                response = requests.get(url, timeout=1)
+            except requests.ConnectionError:
+                time.sleep(0.02)
+                continue
+            if live is None:
+                live = time.perf_counter() - start
+                if not wait_ready:
+                    break
+            elif response.status_code == 200:
+                ready = time.perf_counter() - start
+                break
+            elif response.json().get("status") == "failed":
+                raise RuntimeError(f"Model failed to load: {response.json().get('load_error')}")
+            else:
+                time.sleep(0.1)
+    finally:
+        process.terminate()
+        process.wait()
+    if live is None or (wait_ready and ready is None):
+        raise RuntimeError("Server did not start in time")
+    return live, ready
+
+
+# Import time of the Streamlit apps and time until the model server is live
+# (and ready, with --wait-ready). Fails if a median exceeds its budget.
+def bench_startup(args):
+    results, failures = [], []
+
+    def record(name, samples, budget):
+        samples = sorted(samples)
+        median = samples[len(samples) // 2]
+        results.append({
+            "name": name,
+            "size": None,
+            "iterations": len(samples),
+            "p50_ms": median * 1000,
+            "p95_ms": _percentile(samples, 0.95) * 1000,
+            "p99_ms": _percentile(samples, 0.99) * 1000,
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "throughput": None,
+            "peak_rss_mb": None,
+        })
+        print(f"{name:<28} p50={median * 1000:9.1f}ms budget={budget * 1000 if budget else float('nan'):9.1f}ms")
+        if budget and median > budget:
+            failures.append(f"{name} took {median:.2f}s, budget {budget:.2f}s")
+
+    for module in ("ai_integration_code", "dashboard"):
+        record(f"import {module}", [time_import(module) for _ in range(args.iterations)], args.max_import_seconds)
+
+    timings = [time_server_start(args.port, args.model_path, args.wait_ready) for _ in range(args.iterations)]
+    record("server live", [live for live, _ in timings], args.max_live_seconds)
+    if args.wait_ready:
+        record("server ready", [ready for _, ready in timings], args.max_ready_seconds)
+    return results, failures
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print how each result changed against a previous run's JSON
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\nChange in p50 / p95 against {baseline_path}:")
+    for result in results:
+        old = baseline.get((result["name"], result["size"]))
+        if old:
+            print(f"{result['name']:<28} size={result['size']:<6} "
+                  f"p50 {result['p50_ms'] / old['p50_ms'] - 1:+7.1%}  p95 {result['p95_ms'] / old['p95_ms'] - 1:+7.1%}")
+
+
+def _sizes(text):
+    return [int(part) for part in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency, throughput and memory benchmarks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate-db", help="Write a synthetic users database")
+    generate.add_argument("path")
+    generate.add_argument("--users", type=int, default=1000)
+    generate.add_argument("--drugs-per-user", default="poisson:6", help="fixed:N, uniform:A-B or poisson:MEAN")
+    generate.add_argument("--vocabulary", type=int, default=500, help="Distinct drug names")
+    generate.add_argument("--seed", type=int, default=0)
+
+    run = subparsers.add_parser("run", help="Run the benchmarks")
+    run.add_argument("--suites", default="compatibility,db,graph", help="Comma-separated; env is also available")
+    run.add_argument("--iterations", type=int, default=20)
+    run.add_argument("--regimen-sizes", type=_sizes, default=[2, 4, 8, 16])
+    run.add_argument("--user-counts", type=_sizes, default=[100, 1000, 10000])
+    run.add_argument("--graph-sizes", type=_sizes, default=[10, 50, 150])
+    run.add_argument("--env-rows", type=_sizes, default=[1000, 10000], help="Interaction rows for the env suite")
+    run.add_argument("--num-envs", type=int, default=8, help="Sub-environments per VecDrugInteractionEnv")
+    run.add_argument("--drugs-per-user", default="poisson:6")
+    run.add_argument("--model-url", help="Model server to use; by default a stub server is started")
+    run.add_argument("--stub-port", type=int, default=8017)
+    run.add_argument("--stub-latency", type=float, default=0.05)
+    run.add_argument("--stub-jitter", type=float, default=0.01)
+    run.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    run.add_argument("--compare", help="Results JSON from an earlier run to compare against")
+    startup = subparsers.add_parser("startup", help="Measure cold-start times; exits non-zero over budget (for CI)")
+    startup.add_argument("--iterations", type=int, default=3)
+    startup.add_argument("--port", type=int, default=8018)
+    startup.add_argument("--model-path", help="GGUF file for the server (default: DDI_MODEL_PATH)")
+    startup.add_argument("--wait-ready", action="store_true", help="Also time until the model is loaded")
+    startup.add_argument("--max-import-seconds", type=float, default=3.0)
+    startup.add_argument("--max-live-seconds", type=float, default=5.0)
+    startup.add_argument("--max-ready-seconds", type=float, default=120.0)
+    startup.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    if args.command == "startup":
+        results, failures = bench_startup(args)
+        with open(args.output, "w") as f:
+            json.dump({"revision": git_revision(), "timestamp": time.time(), "python": platform.python_version(),
+                       "platform": platform.platform(), "settings": vars(args), "results": results}, f, indent=2)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1 if failures else 0)
+
+    if args.command == "generate-db":
+        rows = generate_users_db(args.path, args.users, args.drugs_per_user, args.vocabulary, args.seed)
+        print(f"Wrote {args.users} users and {rows} drug rows to {args.path}")
+        return
+
+    suites = args.suites.split(",")
+    workdir = tempfile.mkdtemp(prefix="ddi-bench-")
+    # Keep the verdict cache and any writes away from the real users.db
+    os.environ["DDI_CACHE_DB"] = os.path.join(workdir, "cache.db")
+    db.DB_PATH = os.path.join(workdir, "users.db")
+    db.init_db()
+
+    stub = None
+    if "compatibility" in suites:
+        if not args.model_url:
+            stub = start_stub_server(args.stub_port, args.stub_latency, args.stub_jitter)
+            args.model_url = f"http://127.0.0.1:{args.stub_port}"
+        # Read when model_client is first imported
+        os.environ["DDI_MODEL_API_URL"] = args.model_url
+
+    results = []
+    try:
+        if "compatibility" in suites:
+            results += bench_compatibility(args.regimen_sizes, args.iterations)
+        if "db" in suites:
+            results += bench_db(args.user_counts, args.iterations, workdir, args.drugs_per_user)
+        if "graph" in suites:
+            results += bench_graph(args.graph_sizes, args.iterations)
+        if "env" in suites:
+            results += bench_env(args.env_rows, args.iterations, args.num_envs)
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,13 @@
 import streamlit as st
-import bcrypt
 import sqlite3
-import requests
-import networkx as nx
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-
-# Database setup
-def init_db():
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute(
-        """CREATE TABLE IF NOT EXISTS users
-                 (username TEXT PRIMARY KEY, password TEXT, height FLOAT, weight FLOAT,
-                  comorbidities TEXT, route TEXT, gender TEXT, substance_use TEXT)"""
-    )
-    c.execute(
-        """CREATE TABLE IF NOT EXISTS drugs
-                 (username TEXT, drug_name TEXT, dosage TEXT, FOREIGN KEY(username) REFERENCES users(username))"""
-    )
-    conn.commit()
-    conn.close()
-
-# Add a new user to the database
-def add_user(username, password, height, weight, comorbidities, route, gender, substance_use):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-    c.execute(
-        "INSERT INTO users (username, password, height, weight, comorbidities, route, gender, substance_use) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (username, hashed_password, height, weight, comorbidities, route, gender, substance_use),
-    )
-    conn.commit()
-    conn.close()
-
-# Verify user credentials
-def verify_user(username, password):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("SELECT password FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
-    if result:
-        return bcrypt.checkpw(password.encode(), result[0])
-    return False
-
-# Add drugs to the database
-def add_drugs(username, drug_name, dosage):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("INSERT INTO drugs (username, drug_name, dosage) VALUES (?, ?, ?)", (username, drug_name, dosage))
-    conn.commit()
-    conn.close()
-
-# Fetch user profile data
-def get_user_profile(username):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("SELECT height, weight, comorbidities, route, gender, substance_use FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
-    return result
-
-# Fetch user drugs
-def get_user_drugs(username):
-    conn = sqlite3.connect("users.db")
-    c = conn.cursor()
-    c.execute("SELECT drug_name, dosage FROM drugs WHERE username = ?", (username,))
-    result = c.fetchall()
-    conn.close()
-    return result
+from interaction_graph import create_interaction_graph
+from db import init_db, add_drugs, get_user_profile, update_user_profile, get_user_drugs
+from auth import LoginThrottled, add_user, verify_user
 
 # Function to check drug compatibility using DrugBank API
 def check_drug_compatibility(drugs):
+    import requests
+
     api_key = "YOUR_DRUGBANK_API_KEY"  # Replace with your DrugBank API key
     interactions = []
     for i in range(len(drugs)):
@@ -86,52 +21,6 @@ def check_drug_compatibility(drugs):
                     interactions.append((drugs[i], drugs[j], data["interactions"][0]))
     return interactions
 
-# Function to create an interactive network graph
-def create_interaction_graph(interactions):
-    G = nx.Graph()
-    for interaction in interactions:
-        drug1, drug2, details = interaction
-        severity = details.get("severity", "unknown")
-        G.add_edge(drug1, drug2, weight=severity, details=details)
-
-    pos = nx.spring_layout(G)
-    edge_trace = []
-    for edge in G.edges(data=True):
-        x0, y0 = pos[edge[0]]
-        x1, y1 = pos[edge[1]]
-        severity = edge[2]["weight"]
-        color = "green"
-        if severity == "high":
-            color = "red"
-        elif severity == "moderate":
-            color = "orange"
-        elif severity == "mild":
-            color = "yellow"
-        edge_trace.append(go.Scatter(
-            x=[x0, x1, None], y=[y0, y1, None],
-            line=dict(width=2, color=color),
-            hoverinfo="text",
-            text=f"{edge[0]} - {edge[1]}: {edge[2]['details'].get('description', 'No details')}",
-            mode="lines"))
-
-    node_trace = go.Scatter(
-        x=[], y=[], text=[], mode="markers+text", hoverinfo="text",
-        marker=dict(size=10, color="lightblue"))
-    for node in G.nodes():
-        x, y = pos[node]
-        node_trace["x"] += tuple([x])
-        node_trace["y"] += tuple([y])
-        node_trace["text"] += tuple([node])
-
-    fig = go.Figure(data=edge_trace + [node_trace],
-                    layout=go.Layout(
-                        showlegend=False,
-                        hovermode="closest",
-                        margin=dict(b=0, l=0, r=0, t=0),
-                        xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-                        yaxis=dict(showgrid=False, zeroline=False, showticklabels=False)))
-    return fig
-
 # Login page
 def login_page():
     st.title("Your AI-Powered Medication Safety Guide 🏥")
@@ -151,13 +40,18 @@ def login_page():
         submit_button = st.form_submit_button("Login")
 
         if submit_button:
-            if verify_user(username, password):
-                st.session_state.logged_in = True
-                st.session_state.username = username
-                st.success("Logged in successfully!")
-                st.rerun()  # Rerun the app to immediately show the dashboard
+            try:
+                valid = verify_user(username, password)
+            except LoginThrottled as e:
+                st.error(str(e))
             else:
-                st.error("Invalid username or password.")
+                if valid:
+                    st.session_state.logged_in = True
+                    st.session_state.username = username
+                    st.success("Logged in successfully!")
+                    st.rerun()  # Rerun the app to immediately show the dashboard
+                else:
+                    st.error("Invalid username or password.")
 
     st.markdown("**Don't have an account?**")
     if st.button("Register here!"):
@@ -204,76 +98,6 @@ def registration_page():
         st.session_state.page = "Login"
         st.rerun()
 
-import streamlit as st
-import plotly.graph_objects as go
-import networkx as nx
-from streamlit_extras.stylable_container import stylable_container
-
-def update_user_profile(username, height, weight, comorbidities, route, gender, substance_use):
-    # Placeholder function to simulate updating user profile
-    st.session_state.user_profile = {
-        "height": height,
-        "weight": weight,
-        "comorbidities": comorbidities,
-        "route": route,
-        "gender": gender,
-        "substance_use": substance_use,
-    }
-
-def create_interaction_graph(interactions):
-    G = nx.Graph()
-    
-    severity_colors = {
-        'high': 'red',
-        'moderate': 'orange',
-        'mild': 'yellow',
-        'none': 'green'
-    }
-    
-    for interaction in interactions:
-        drug1, drug2, details = interaction
-        severity = details.get('severity', 'none')
-        description = details.get('description', 'No details')
-        color = severity_colors.get(severity, 'gray')
-        weight = {'high': 4, 'moderate': 3, 'mild': 2, 'none': 1}.get(severity, 1)
-        G.add_edge(drug1, drug2, weight=weight, color=color, description=description)
-    
-    pos = nx.spring_layout(G)
-    edge_x, edge_y, edge_text, edge_colors, edge_widths = [], [], [], [], []
-    
-    for edge in G.edges(data=True):
-        x0, y0 = pos[edge[0]]
-        x1, y1 = pos[edge[1]]
-        edge_x.extend([x0, x1, None])
-        edge_y.extend([y0, y1, None])
-        edge_text.append(f"{edge[0]} - {edge[1]}: {edge[2]['description']}")
-        edge_colors.append(edge[2]['color'])
-        edge_widths.append(edge[2]['weight'])
-    
-    node_x, node_y, node_text = [], [], []
-    for node in G.nodes():
-        x, y = pos[node]
-        node_x.append(x)
-        node_y.append(y)
-        node_text.append(node)
-    
-    edge_trace = go.Scatter(
-        x=edge_x, y=edge_y,
-        line=dict(width=edge_widths, color=edge_colors),
-        hoverinfo='text',
-        text=edge_text,
-        mode='lines')
-    
-    node_trace = go.Scatter(
-        x=node_x, y=node_y,
-        mode='markers+text',
-        text=node_text,
-        hoverinfo='text',
-        marker=dict(size=10, color='blue'))
-    
-    fig = go.Figure(data=[edge_trace, node_trace],
-                    layout=go.Layout(title='Drug Interaction Network', showlegend=False))
-    return fig
 
 def dashboard_page():
     st.set_page_config(layout="wide")
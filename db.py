@@ -0,0 +1,177 @@
+import os
+import sqlite3
+import threading
+import time
+
+from drug_names import get_default_names
+from tracing import traced
+
+DB_PATH = os.environ.get("DDI_DB_PATH", "users.db")
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Append new steps; never edit one that has shipped.
+MIGRATIONS = [
+    [
+        """CREATE TABLE IF NOT EXISTS users
+                 (username TEXT PRIMARY KEY, password TEXT, height FLOAT, weight FLOAT,
+                  comorbidities TEXT, route TEXT, gender TEXT, substance_use TEXT)""",
+        """CREATE TABLE IF NOT EXISTS drugs
+                 (username TEXT, drug_name TEXT, dosage TEXT, FOREIGN KEY(username) REFERENCES users(username))""",
+        "CREATE INDEX IF NOT EXISTS idx_drugs_username ON drugs(username)",
+    ],
+    [
+        # Canonical drug ID from drug_names, so spellings of one drug share a key
+        "ALTER TABLE drugs ADD COLUMN drug_id TEXT",
+    ],
+    [
+        # Per-user pairwise verdicts; drug1 < drug2, both normalized canonical names
+        """CREATE TABLE IF NOT EXISTS interactions
+                 (username TEXT, drug1 TEXT, drug2 TEXT, verdict TEXT, model_version TEXT, updated_at FLOAT,
+                  PRIMARY KEY (username, drug1, drug2))""",
+    ],
+    [
+        # "high", "moderate", "mild" or "none" when the model graded the pair; NULL otherwise
+        "ALTER TABLE interactions ADD COLUMN severity TEXT",
+    ],
+]
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+_profile_cache = {}
+_profile_lock = threading.Lock()
+
+
+# Connection for the current thread, opened once and reused
+def get_connection(db_path=None):
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[db_path] = conn
+    return conn
+
+
+# Database setup: bring the schema up to date once per process
+def init_db(db_path=None):
+    db_path = db_path or DB_PATH
+    if db_path in _migrated:
+        return
+    with _migrate_lock:
+        if db_path in _migrated:
+            return
+        conn = get_connection(db_path)
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+        _migrated.add(db_path)
+
+
+# Add a new user to the database; the password is hashed by auth.add_user
+def add_user(username, hashed_password, height, weight, comorbidities, route, gender, substance_use):
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO users (username, password, height, weight, comorbidities, route, gender, substance_use) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (username, hashed_password, height, weight, comorbidities, route, gender, substance_use),
+        )
+    _invalidate_profile(username)
+
+
+# Fetch the stored bcrypt hash for a user, or None if there is no such user
+@traced("db.get_password_hash")
+def get_password_hash(username):
+    result = get_connection().execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+    return result[0] if result else None
+
+
+# Add drugs to the database, recording the canonical drug ID when the name resolves
+@traced("db.add_drugs")
+def add_drugs(username, drug_name, dosage):
+    drug_id = get_default_names().resolve(drug_name)
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO drugs (username, drug_name, dosage, drug_id) VALUES (?, ?, ?, ?)",
+            (username, drug_name, dosage, drug_id),
+        )
+    return drug_id
+
+
+# Fetch user profile data, served from memory until the profile changes
+@traced("db.get_user_profile")
+def get_user_profile(username):
+    with _profile_lock:
+        if username in _profile_cache:
+            return _profile_cache[username]
+    result = get_connection().execute(
+        "SELECT height, weight, comorbidities, route, gender, substance_use FROM users WHERE username = ?", (username,)
+    ).fetchone()
+    if result is not None:
+        with _profile_lock:
+            _profile_cache[username] = result
+    return result
+
+
+# Save edits to a user's profile
+def update_user_profile(username, height, weight, comorbidities, route, gender, substance_use):
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE users SET height = ?, weight = ?, comorbidities = ?, route = ?, gender = ?, substance_use = ? WHERE username = ?",
+            (height, weight, comorbidities, route, gender, substance_use, username),
+        )
+        # Verdicts were computed for the old profile
+        conn.execute("DELETE FROM interactions WHERE username = ?", (username,))
+    _invalidate_profile(username)
+
+
+def _invalidate_profile(username):
+    with _profile_lock:
+        _profile_cache.pop(username, None)
+
+
+# Fetch user drugs
+@traced("db.get_user_drugs")
+def get_user_drugs(username):
+    return get_connection().execute("SELECT drug_name, dosage FROM drugs WHERE username = ?", (username,)).fetchall()
+
+
+# Stored verdicts for a user as {(drug1, drug2): (verdict, severity)}, only
+# those computed by the given model version
+@traced("db.get_user_interactions")
+def get_user_interactions(username, model_version):
+    rows = get_connection().execute(
+        "SELECT drug1, drug2, verdict, severity FROM interactions WHERE username = ? AND model_version = ?",
+        (username, model_version),
+    ).fetchall()
+    return {(drug1, drug2): (verdict, severity) for drug1, drug2, verdict, severity in rows}
+
+
+# Store (drug1, drug2, verdict, severity) rows for a user in one transaction
+def save_user_interactions(username, rows, model_version):
+    save_interactions([(username,) + tuple(row) for row in rows], model_version)
+
+
+# Store (username, drug1, drug2, verdict, severity) rows for any number of
+# users in one transaction; severity may be None
+@traced("db.save_interactions")
+def save_interactions(rows, model_version):
+    now = time.time()
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO interactions (username, drug1, drug2, verdict, severity, model_version, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((username, drug1, drug2, verdict, severity, model_version, now)
+             for username, drug1, drug2, verdict, severity in rows),
+        )
+
+
+# Stream every (username, drug_name) row, grouped by user
+def iter_all_drugs():
+    return get_connection().execute("SELECT username, drug_name FROM drugs ORDER BY username")
@@ -0,0 +1,142 @@
+import argparse
+import csv
+import json
+import os
+import threading
+
+import numpy as np
+
+from drug_names import get_default_names, load_vocabulary
+from interaction_cache import normalize_drug
+
+# Base path of the compiled index: <base>.keys.npy, <base>.labels.npy, <base>.ids.json
+DDI_INDEX_PATH = os.environ.get("DDI_INDEX_PATH", os.path.join("data", "ddi_index"))
+
+
+def _pair_keys(ids1, ids2):
+    ids1 = np.asarray(ids1, dtype=np.uint64)
+    ids2 = np.asarray(ids2, dtype=np.uint64)
+    low, high = np.minimum(ids1, ids2), np.maximum(ids1, ids2)
+    return (low << np.uint64(32)) | high
+
+
+class DDIIndex:
+    """
+    Known drug-drug interactions compiled from DrugBank. Drug names and IDs
+    map to ints; each unordered pair is one uint64 key in a sorted array that
+    is memory-mapped, so lookups are a binary search and every process that
+    opens the index shares the same pages.
+    """
+
+    def __init__(self, base_path=DDI_INDEX_PATH):
+        self.keys = np.load(f"{base_path}.keys.npy", mmap_mode="r")
+        self.labels = np.load(f"{base_path}.labels.npy", mmap_mode="r")
+        with open(f"{base_path}.ids.json") as f:
+            self.ids = json.load(f)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def drug_id(self, name):
+        drug_id = self.ids.get(normalize_drug(name))
+        if drug_id is None:
+            # Brand names, misspellings and "500 mg" suffixes go through the name index
+            resolved = get_default_names().resolve(name)
+            if resolved is not None:
+                drug_id = self.ids.get(normalize_drug(resolved))
+        return drug_id
+
+    # DrugBank interaction type for a pair, or None if the pair is not known
+    def lookup(self, drug1, drug2):
+        id1, id2 = self.drug_id(drug1), self.drug_id(drug2)
+        if id1 is None or id2 is None:
+            return None
+        key = _pair_keys([id1], [id2])[0]
+        position = int(np.searchsorted(self.keys, key))
+        if position < len(self.keys) and self.keys[position] == key:
+            return int(self.labels[position])
+        return None
+
+
+# Compile (drug1, drug2, label) rows into an index at `base_path`.
+# `synonyms` optionally maps extra names (brand names, common names) to the
+# identifiers used in the rows, so they resolve to the same drug.
+def build_index(rows, base_path=DDI_INDEX_PATH, synonyms=None):
+    ids = {}
+    ids1, ids2, labels = [], [], []
+    for drug1, drug2, label in rows:
+        ids1.append(ids.setdefault(normalize_drug(drug1), len(ids)))
+        ids2.append(ids.setdefault(normalize_drug(drug2), len(ids)))
+        labels.append(int(label))
+    for name, target in (synonyms or {}).items():
+        target_id = ids.get(normalize_drug(target))
+        if target_id is not None:
+            ids.setdefault(normalize_drug(name), target_id)
+
+    keys = _pair_keys(ids1, ids2)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    labels = np.asarray(labels, dtype=np.int16)[order]
+    # Symmetric duplicates collapse to their first occurrence
+    unique = np.ones(len(keys), dtype=bool)
+    unique[1:] = keys[1:] != keys[:-1]
+
+    os.makedirs(os.path.dirname(base_path) or ".", exist_ok=True)
+    np.save(f"{base_path}.keys.npy", keys[unique])
+    np.save(f"{base_path}.labels.npy", labels[unique])
+    with open(f"{base_path}.ids.json", "w") as f:
+        json.dump(ids, f)
+    return int(unique.sum())
+
+
+# Rows from TDC's DrugBank DDI set, keyed by DrugBank ID (the Drug1/Drug2
+# columns hold SMILES strings)
+def load_tdc_rows():
+    from tdc.multi_pred import DDI
+
+    df = DDI(name="DrugBank").get_data()
+    return zip(df["Drug1_ID"], df["Drug2_ID"], df["Y"])
+
+
+# Rows from a CSV with Drug1_ID, Drug2_ID and Y columns
+def load_csv_rows(path):
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield row["Drug1_ID"], row["Drug2_ID"], row["Y"]
+
+
+_default_index = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+# Process-wide index, opened on first use; None if it has not been built
+def get_default_index():
+    global _default_index, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            _default_loaded = True
+            try:
+                _default_index = DDIIndex()
+            except FileNotFoundError:
+                _default_index = None
+        return _default_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile known DrugBank interactions into a memory-mapped index.")
+    parser.add_argument("--input", help="CSV with Drug1_ID, Drug2_ID, Y columns (default: download via TDC)")
+    parser.add_argument("--vocabulary", help="DrugBank vocabulary CSV, to resolve drug names to IDs")
+    parser.add_argument("--output", default=DDI_INDEX_PATH, help="Base path of the index files")
+    args = parser.parse_args()
+
+    rows = load_csv_rows(args.input) if args.input else load_tdc_rows()
+    synonyms = None
+    if args.vocabulary:
+        vocabulary = load_vocabulary(args.vocabulary)
+        synonyms = {name: drugbank_id for drugbank_id, names in vocabulary.items() for name in names}
+    count = build_index(rows, args.output, synonyms)
+    print(f"Wrote {count} interaction pairs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
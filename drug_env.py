@@ -0,0 +1,104 @@
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+
+
+# Map both drug columns onto one shared index and stack them as float32
+# (N, 2) observations next to an int64 label array, once for the whole run.
+# Returns (observations, labels, vocabulary).
+def encode_interactions(drug1, drug2, labels):
+    drug1, drug2 = np.asarray(drug1), np.asarray(drug2)
+    vocabulary, codes = np.unique(np.concatenate([drug1, drug2]), return_inverse=True)
+    observations = np.ascontiguousarray(codes.reshape(2, -1).T, dtype=np.float32)
+    return observations, np.asarray(labels, dtype=np.int64), vocabulary
+
+
+class VecDrugInteractionEnv(VecEnv):
+    """
+    The notebook's DrugInteractionEnv (observe a drug pair, answer 1 or 0,
+    reward +1 if that matches the label and -1 if not) as K sub-environments
+    stepped together. The data is encoded into NumPy arrays once. Each epoch
+    draws one permutation and gathers the observations in that order into a
+    contiguous array, so step t of every sub-environment is rows
+    [t*K, (t+1)*K) and each batch of observations is a slice of it, not a
+    copy. An episode is one pass over the data; the rows left over when N is
+    not a multiple of K sit out that epoch, and a different few each time.
+    """
+
+    def __init__(self, observations, labels, num_envs=8, seed=None):
+        if len(observations) < num_envs:
+            raise ValueError(f"Need at least {num_envs} rows for {num_envs} environments, got {len(observations)}.")
+        high = float(observations.max()) if len(observations) else 0.0
+        super().__init__(
+            num_envs,
+            spaces.Box(low=0, high=high, shape=(2,), dtype=np.float32),
+            spaces.Discrete(2),
+        )
+        self.observations = observations
+        self.labels = labels
+        self.steps_per_epoch = len(observations) // num_envs
+        self._rng = np.random.default_rng(seed)
+        self._actions = None
+        self._shuffle()
+
+    # From a table with the TDC columns (see training_data)
+    @classmethod
+    def from_table(cls, table, drug1="Drug1_ID", drug2="Drug2_ID", label="Y", **kwargs):
+        observations, labels, _ = encode_interactions(
+            table.column(drug1).to_numpy(zero_copy_only=False),
+            table.column(drug2).to_numpy(zero_copy_only=False),
+            table.column(label).to_numpy(zero_copy_only=False),
+        )
+        return cls(observations, labels, **kwargs)
+
+    def _shuffle(self):
+        order = self._rng.permutation(len(self.observations))[:self.steps_per_epoch * self.num_envs]
+        # New arrays rather than in-place shuffles, so observations already
+        # handed out stay valid
+        self._epoch_observations = self.observations[order]
+        self._epoch_labels = self.labels[order]
+        self._step = 0
+
+    def _batch(self, step):
+        return slice(step * self.num_envs, (step + 1) * self.num_envs)
+
+    def reset(self):
+        self._shuffle()
+        return self._epoch_observations[self._batch(0)]
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions)
+
+    def step_wait(self):
+        current = self._batch(self._step)
+        rewards = np.where(self._actions == self._epoch_labels[current], 1.0, -1.0).astype(np.float32)
+        self._step += 1
+        if self._step < self.steps_per_epoch:
+            dones = np.zeros(self.num_envs, dtype=bool)
+            infos = [{} for _ in range(self.num_envs)]
+            return self._epoch_observations[self._batch(self._step)], rewards, dones, infos
+
+        # End of the epoch: every sub-environment finishes its episode together
+        terminal = np.zeros(self.observation_space.shape, dtype=np.float32)
+        dones = np.ones(self.num_envs, dtype=bool)
+        infos = [{"terminal_observation": terminal, "TimeLimit.truncated": False} for _ in range(self.num_envs)]
+        return self.reset(), rewards, dones, infos
+
+    def seed(self, seed=None):
+        self._rng = np.random.default_rng(seed)
+        return [seed] * self.num_envs
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
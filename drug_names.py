@@ -0,0 +1,237 @@
+import argparse
+import bisect
+import csv
+import difflib
+import json
+import os
+import re
+import threading
+
+DRUG_NAMES_PATH = os.environ.get("DDI_DRUG_NAMES_PATH", os.path.join("data", "drug_names.json"))
+# Similarity a misspelling needs to be offered as a suggestion
+FUZZY_THRESHOLD = float(os.environ.get("DDI_FUZZY_THRESHOLD", "0.85"))
+
+# Common brand and regional names, mapped to the generic name DrugBank uses
+BUILTIN_SYNONYMS = {
+    "tylenol": "acetaminophen",
+    "panadol": "acetaminophen",
+    "paracetamol": "acetaminophen",
+    "apap": "acetaminophen",
+    "advil": "ibuprofen",
+    "motrin": "ibuprofen",
+    "aleve": "naproxen",
+    "aspirin": "acetylsalicylic acid",
+    "asa": "acetylsalicylic acid",
+    "coumadin": "warfarin",
+    "jantoven": "warfarin",
+    "plavix": "clopidogrel",
+    "eliquis": "apixaban",
+    "xarelto": "rivaroxaban",
+    "lipitor": "atorvastatin",
+    "zocor": "simvastatin",
+    "crestor": "rosuvastatin",
+    "glucophage": "metformin",
+    "synthroid": "levothyroxine",
+    "norvasc": "amlodipine",
+    "zestril": "lisinopril",
+    "prinivil": "lisinopril",
+    "lasix": "furosemide",
+    "prilosec": "omeprazole",
+    "nexium": "esomeprazole",
+    "prozac": "fluoxetine",
+    "zoloft": "sertraline",
+    "lexapro": "escitalopram",
+    "xanax": "alprazolam",
+    "valium": "diazepam",
+    "ativan": "lorazepam",
+    "ambien": "zolpidem",
+    "neurontin": "gabapentin",
+    "lyrica": "pregabalin",
+    "ultram": "tramadol",
+    "oxycontin": "oxycodone",
+    "percocet": "oxycodone",
+    "vicodin": "hydrocodone",
+    "benadryl": "diphenhydramine",
+    "zyrtec": "cetirizine",
+    "claritin": "loratadine",
+    "viagra": "sildenafil",
+    "cialis": "tadalafil",
+}
+
+# Strengths and dosage forms that users type after the drug name
+_STRENGTH = re.compile(r"\b\d+(?:[.,]\d+)?\s*(?:mg|mcg|µg|ug|g|ml|l|iu|units?|%)?(?=\s|$|/)")
+_FORMS = {
+    "tablet", "tablets", "tab", "tabs", "capsule", "capsules", "cap", "caps", "oral", "injection",
+    "solution", "suspension", "syrup", "cream", "ointment", "patch", "er", "xr", "sr", "dr",
+}
+
+
+# Lower-case a free-text drug name and drop strengths, dosage forms and punctuation
+def normalize_name(text):
+    text = str(text).lower().replace("-", " ")
+    text = _STRENGTH.sub(" ", text)
+    text = re.sub(r"[^\w\s]", " ", text)
+    words = [word for word in text.split() if word not in _FORMS]
+    return " ".join(words)
+
+
+def _trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DrugNameIndex:
+    """
+    Resolves free-text drug names to canonical drug IDs. Exact matches go
+    through a dict of normalized names and synonyms; prefix search (for
+    autocomplete) is a binary search over the sorted names; misspellings are
+    matched through a character-trigram index and ranked by similarity.
+    Misspellings are only ever suggested, never resolved: look-alike drugs
+    (prednisone and prednisolone, quinine and quinidine) score as high as
+    typos do, so the user has to pick the match.
+    """
+
+    def __init__(self, names, canonical):
+        # names: normalized name -> drug ID; canonical: drug ID -> display name
+        self.names = names
+        self.canonical = canonical
+        self._sorted = sorted(names)
+        self._trigram_index = {}
+        for position, name in enumerate(self._sorted):
+            for trigram in _trigrams(name):
+                self._trigram_index.setdefault(trigram, []).append(position)
+
+    @classmethod
+    def load(cls, path=DRUG_NAMES_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["names"], data["canonical"])
+
+    def save(self, path=DRUG_NAMES_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"names": self.names, "canonical": self.canonical}, f)
+
+    def __len__(self):
+        return len(self.canonical)
+
+    # Drug ID for a name or synonym, or None if it is not known exactly (see
+    # fuzzy for candidates to offer instead)
+    def resolve(self, text):
+        name = normalize_name(text)
+        if not name:
+            return None
+        return self.names.get(name)
+
+    # Display name for a free-text drug name; unknown names come back cleaned up
+    def canonical_name(self, text):
+        drug_id = self.resolve(text)
+        if drug_id is None:
+            return normalize_name(text) or str(text).strip()
+        return self.canonical[drug_id]
+
+    # Known names starting with the given text, for autocomplete
+    def suggest(self, prefix, limit=10):
+        prefix = normalize_name(prefix)
+        results = []
+        position = bisect.bisect_left(self._sorted, prefix)
+        while position < len(self._sorted) and len(results) < limit:
+            name = self._sorted[position]
+            if not name.startswith(prefix):
+                break
+            results.append(name)
+            position += 1
+        return results
+
+    # Names most similar to `name`, best first
+    def fuzzy(self, name, limit=5, threshold=FUZZY_THRESHOLD):
+        counts = {}
+        for trigram in _trigrams(name):
+            for position in self._trigram_index.get(trigram, ()):
+                counts[position] = counts.get(position, 0) + 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[:25]
+        scored = []
+        for position in candidates:
+            candidate = self._sorted[position]
+            ratio = difflib.SequenceMatcher(None, name, candidate).ratio()
+            if ratio >= threshold:
+                scored.append((ratio, candidate))
+        scored.sort(reverse=True)
+        return [candidate for _, candidate in scored[:limit]]
+
+    # Collapse a user's (drug_name, dosage) list to one entry per canonical
+    # drug, keeping the first dosage seen and the canonical name
+    def dedupe_drugs(self, drugs):
+        seen = set()
+        result = []
+        for drug_name, dosage in drugs:
+            drug_id = self.resolve(drug_name)
+            key = drug_id if drug_id is not None else normalize_name(drug_name)
+            if key in seen:
+                continue
+            seen.add(key)
+            result.append((self.canonical[drug_id] if drug_id is not None else drug_name, dosage))
+        return result
+
+
+# Build the index from DrugBank vocabulary entries (DrugBank ID -> names, the
+# first name being the common name) plus the built-in brand synonyms
+def build_name_index(vocabulary=None, synonyms=BUILTIN_SYNONYMS):
+    names, canonical = {}, {}
+    for drugbank_id, drug_names in (vocabulary or {}).items():
+        canonical[drugbank_id] = drug_names[0]
+        for name in drug_names:
+            normalized = normalize_name(name)
+            if normalized:
+                names.setdefault(normalized, drugbank_id)
+    for synonym, generic in synonyms.items():
+        generic = normalize_name(generic)
+        if generic not in names:
+            # Without a vocabulary the generic name is its own ID
+            names[generic] = generic
+            canonical.setdefault(generic, generic.title())
+        names.setdefault(normalize_name(synonym), names[generic])
+    return DrugNameIndex(names, canonical)
+
+
+# DrugBank ID -> [common name, synonyms...] from the DrugBank open vocabulary CSV
+def load_vocabulary(path):
+    vocabulary = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            names = [row.get("Common name", "")] + (row.get("Synonyms") or "").split(" | ")
+            names = [name.strip() for name in names if name.strip()]
+            if names:
+                vocabulary[row["DrugBank ID"]] = names
+    return vocabulary
+
+
+_default_names = None
+_default_lock = threading.Lock()
+
+# Process-wide name index: the prebuilt file if present, else the built-in synonyms
+def get_default_names():
+    global _default_names
+    with _default_lock:
+        if _default_names is None:
+            try:
+                _default_names = DrugNameIndex.load()
+            except FileNotFoundError:
+                _default_names = build_name_index()
+        return _default_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the drug name and synonym index.")
+    parser.add_argument("--vocabulary", help="DrugBank vocabulary CSV (DrugBank ID, Common name, Synonyms)")
+    parser.add_argument("--output", default=DRUG_NAMES_PATH, help="Where to write the index")
+    args = parser.parse_args()
+
+    vocabulary = load_vocabulary(args.vocabulary) if args.vocabulary else None
+    index = build_name_index(vocabulary)
+    index.save(args.output)
+    print(f"Wrote {len(index.names)} names for {len(index)} drugs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
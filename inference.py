@@ -0,0 +1,187 @@
+import functools
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Operations run inside a scheduler worker against its own llama.cpp context
+
+PREFIX_CACHE_SIZE = int(os.environ.get("DDI_PREFIX_CACHE_SIZE", "8"))
+
+
+class PrefixCache:
+    """
+    Bounded LRU of saved llama.cpp states for registered prompt prefixes.
+    Before a prompt is evaluated, the state of the longest registered prefix
+    it starts with is restored (or computed and saved on first use), so only
+    the prompt's own suffix has to be evaluated. Pinned prefixes (the ones
+    the server registers at startup) are never evicted and do not count
+    against the capacity, so client-supplied prefixes cannot push them out.
+    """
+
+    def __init__(self, capacity=PREFIX_CACHE_SIZE):
+        self.capacity = max(1, capacity)
+        self._prefixes = OrderedDict()
+        self._states = OrderedDict()
+        self._pinned = set()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def register(self, prefix, pinned=False):
+        if not prefix:
+            return
+        if pinned:
+            self._pinned.add(prefix)
+        self._prefixes[prefix] = None
+        self._prefixes.move_to_end(prefix)
+        for old in self._evict(self._prefixes):
+            self._states.pop(old, None)
+
+    # Drop the least recently used unpinned entries until the rest fit the
+    # capacity, and return the prefixes dropped
+    def _evict(self, entries):
+        unpinned = [prefix for prefix in entries if prefix not in self._pinned]
+        evicted = unpinned[:max(0, len(unpinned) - self.capacity)]
+        for old in evicted:
+            del entries[old]
+        return evicted
+
+    def _match(self, prompt):
+        matches = [prefix for prefix in self._prefixes if prompt.startswith(prefix)]
+        return max(matches, key=len) if matches else None
+
+    # Put the context into the state of the prompt's registered prefix, if any
+    def restore(self, llm, prompt):
+        prefix = self._match(prompt)
+        if prefix is None:
+            return
+        entry = self._states.get(prefix)
+        if entry is not None:
+            tokens, state = entry
+            self._states.move_to_end(prefix)
+            self._prefixes.move_to_end(prefix)
+            self.stats["hits"] += 1
+            # The context may already hold the prefix from the previous request
+            if llm.n_tokens < len(tokens) or list(llm.input_ids[:len(tokens)]) != tokens:
+                llm.load_state(state)
+            return
+
+        self.stats["misses"] += 1
+        tokens = llm.tokenize(prefix.encode("utf-8"))
+        llm.reset()
+        llm.eval(tokens)
+        self._states[prefix] = (tokens, llm.save_state())
+        self.stats["evictions"] += len(self._evict(self._states))
+
+    # Evaluate every registered prefix up front so the first requests hit
+    def warm(self, llm):
+        for prefix in list(self._prefixes):
+            self.restore(llm, prefix)
+
+
+def _log_softmax(logits):
+    logits = np.asarray(logits, dtype=np.float64)
+    shifted = logits - logits.max()
+    return shifted - np.log(np.exp(shifted).sum())
+
+
+# Evaluate the prompt, reusing whatever leading tokens the context already holds
+def _eval_prompt(llm, prompt_tokens):
+    common = 0
+    limit = min(llm.n_tokens, len(prompt_tokens) - 1)
+    while common < limit and llm.input_ids[common] == prompt_tokens[common]:
+        common += 1
+    llm.n_tokens = common
+    llm.eval(prompt_tokens[common:])
+
+
+# Grammar for a JSON schema (given as a JSON string), compiled once per schema
+@functools.lru_cache(maxsize=32)
+def _json_grammar(json_schema):
+    from llama_cpp import LlamaGrammar
+
+    return LlamaGrammar.from_json_schema(json_schema, verbose=False)
+
+
+# Free-text completion. The prompt is evaluated up front (after restoring its
+# prefix state) so its cost can be timed apart from generation; Llama.generate
+# then skips the tokens the context already holds. With `json_schema` the
+# output is constrained to JSON matching it.
+def generate(llm, prompt, max_tokens=200, temperature=0.3, prefix=None, prefix_cache=None, timings=None,
+             json_schema=None, should_stop=None):
+    start = time.perf_counter()
+    prompt_tokens = llm.tokenize(prompt.encode("utf-8"))
+    if prefix_cache is not None:
+        prefix_cache.register(prefix)
+        prefix_cache.restore(llm, prompt)
+    _eval_prompt(llm, prompt_tokens)
+    evaluated = time.perf_counter()
+    grammar = _json_grammar(json_schema) if json_schema else None
+    # `should_stop()` is polled after every token; true ends the generation early
+    stopping_criteria = None
+    if should_stop is not None:
+        from llama_cpp import StoppingCriteriaList
+
+        stopping_criteria = StoppingCriteriaList([lambda tokens, logits: should_stop()])
+    result = llm(prompt, max_tokens=max_tokens, temperature=temperature, grammar=grammar,
+                 stopping_criteria=stopping_criteria)
+    if timings is not None:
+        timings.update(
+            prompt_eval=evaluated - start,
+            generation=time.perf_counter() - evaluated,
+            prompt_tokens=len(prompt_tokens),
+            completion_tokens=result.get("usage", {}).get("completion_tokens", 0),
+        )
+    return result
+
+
+# Score each candidate label as a continuation of the prompt and return the
+# most likely one. The prompt is evaluated once (minus any cached prefix); the
+# first token of every label is scored from those logits, and only labels that
+# share a first token with another label get their remaining tokens evaluated
+# (by rewinding the context to the end of the prompt).
+def classify(llm, prompt, labels=("+1", "-1"), prefix=None, prefix_cache=None, timings=None):
+    start = time.perf_counter()
+    prompt_tokens = llm.tokenize(prompt.encode("utf-8"))
+    if prefix_cache is not None:
+        prefix_cache.register(prefix)
+        prefix_cache.restore(llm, prompt)
+    _eval_prompt(llm, prompt_tokens)
+    n_prompt = llm.n_tokens
+    evaluated = time.perf_counter()
+    first_logprobs = _log_softmax(llm.scores[n_prompt - 1])
+
+    label_tokens = [llm.tokenize(label.encode("utf-8"), add_bos=False) for label in labels]
+    first_counts = {}
+    for tokens in label_tokens:
+        first_counts[tokens[0]] = first_counts.get(tokens[0], 0) + 1
+
+    scores = []
+    for tokens in label_tokens:
+        score = float(first_logprobs[tokens[0]])
+        if first_counts[tokens[0]] > 1:
+            llm.n_tokens = n_prompt
+            for previous, token in zip(tokens, tokens[1:]):
+                llm.eval([previous])
+                score += float(_log_softmax(llm.scores[llm.n_tokens - 1])[token])
+        scores.append(score)
+
+    probabilities = np.exp(np.array(scores) - max(scores))
+    probabilities /= probabilities.sum()
+    best = int(np.argmax(probabilities))
+    if timings is not None:
+        timings.update(
+            prompt_eval=evaluated - start,
+            generation=time.perf_counter() - evaluated,
+            prompt_tokens=n_prompt,
+            completion_tokens=0,
+        )
+    return {
+        "label": labels[best],
+        "probability": float(probabilities[best]),
+        "scores": dict(zip(labels, scores)),
+        "prompt_tokens": n_prompt,
+    }
+
+
+TASKS = {"generate": generate, "classify": classify}
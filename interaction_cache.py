@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DB_PATH = os.environ.get("DDI_CACHE_DB", os.environ.get("DDI_DB_PATH", "users.db"))
+CACHE_TTL = float(os.environ.get("DDI_CACHE_TTL", str(30 * 24 * 3600)))
+CACHE_MEMORY_SIZE = int(os.environ.get("DDI_CACHE_MEMORY_SIZE", "4096"))
+CACHE_DISK_SIZE = int(os.environ.get("DDI_CACHE_DISK_SIZE", "500000"))
+
+# Normalize a drug name so "Warfarin " and "warfarin" share an entry
+def normalize_drug(name):
+    return " ".join(str(name).strip().lower().split())
+
+# Order-independent key for a drug pair under a given prompt/model version
+def pair_key(drug1, drug2, version):
+    a, b = sorted((normalize_drug(drug1), normalize_drug(drug2)))
+    return f"{version}|{a}|{b}"
+
+
+class InteractionCache:
+    """
+    Two-tier cache of pairwise interaction verdicts: an in-process LRU in
+    front of a SQLite table. Entries expire after `ttl` seconds and both
+    tiers are size-bounded, evicting the least recently used entries.
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH, ttl=CACHE_TTL,
+                 memory_size=CACHE_MEMORY_SIZE, disk_size=CACHE_DISK_SIZE):
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_trim = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        # Batch screening shares the file across many processes: wait out
+        # their writes instead of failing with "database is locked"
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS interaction_cache
+                     (key TEXT PRIMARY KEY, verdict TEXT, created_at FLOAT, accessed_at FLOAT)"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_interaction_cache_accessed ON interaction_cache(accessed_at)"
+        )
+        self._conn.commit()
+
+    def _expired(self, created_at, now):
+        return self.ttl > 0 and now - created_at > self.ttl
+
+    def _remember(self, key, verdict, created_at):
+        self._lru[key] = (verdict, created_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_size:
+            self._lru.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, drug1, drug2, version):
+        key = pair_key(drug1, drug2, version)
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._lru.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[0]
+                del self._lru[key]
+
+            row = self._conn.execute(
+                "SELECT verdict, created_at FROM interaction_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            verdict, created_at = row
+            if self._expired(created_at, now):
+                self._conn.execute("DELETE FROM interaction_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE interaction_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, verdict, created_at)
+            self.stats["disk_hits"] += 1
+            return verdict
+
+    def put(self, drug1, drug2, version, verdict):
+        key = pair_key(drug1, drug2, version)
+        now = time.time()
+        with self._lock:
+            self._remember(key, verdict, now)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO interaction_cache (key, verdict, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, verdict, now, now),
+            )
+            self._puts_since_trim += 1
+            # Trimming needs a COUNT(*), so only do it every so often
+            if self._puts_since_trim >= 100:
+                self._trim_disk()
+            self._conn.commit()
+
+    def _trim_disk(self):
+        self._puts_since_trim = 0
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM interaction_cache").fetchone()
+        excess = count - self.disk_size
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM interaction_cache WHERE key IN "
+                "(SELECT key FROM interaction_cache ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            self.stats["evictions"] += excess
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._conn.execute("DELETE FROM interaction_cache")
+            self._conn.commit()
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+# Process-wide cache shared by every Streamlit session and rerun
+def get_default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = InteractionCache()
+        return _default_cache
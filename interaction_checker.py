@@ -0,0 +1,438 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from db import get_user_drugs, get_user_interactions, get_user_profile, save_user_interactions
+from drug_names import get_default_names
+from interaction_cache import get_default_cache, normalize_drug
+from interaction_prompt import PROMPT_VERSION, VERDICT_LABELS, build_interaction_prompt, parse_verdict
+from tracing import bind, span, trace
+
+# The model server endpoint is configured in model_client (DDI_MODEL_API_URL)
+
+# Concurrency settings for the pairwise checks
+MAX_IN_FLIGHT = int(os.environ.get("DDI_MAX_IN_FLIGHT", "8"))
+PAIR_TIMEOUT = float(os.environ.get("DDI_PAIR_TIMEOUT", "30"))
+# Ceiling on a whole-regimen call (matrix or regimen prompt). Past it the call
+# is abandoned and the pairs are checked one at a time, each under PAIR_TIMEOUT,
+# so a long regimen cannot hold the caller for PAIR_TIMEOUT per pair.
+REGIMEN_CALL_TIMEOUT = float(os.environ.get("DDI_REGIMEN_CALL_TIMEOUT", "60"))
+# Ask the server for the whole regimen in one call instead of one call per pair
+USE_MATRIX_ENDPOINT = os.environ.get("DDI_USE_MATRIX_ENDPOINT", "1") == "1"
+# Score the verdict labels directly instead of generating and parsing free text
+USE_CLASSIFIER = os.environ.get("DDI_USE_CLASSIFIER", "1") == "1"
+# Settle confidently scored pairs with the NumPy pair classifier (see
+# pair_classifier; a no-op until it has been trained)
+USE_PAIR_CLASSIFIER = os.environ.get("DDI_USE_PAIR_CLASSIFIER", "1") == "1"
+# Grade the whole regimen with one prompt that includes the patient profile,
+# instead of one prompt per pair (see the server's /interactions/regimen)
+USE_REGIMEN_PROMPT = os.environ.get("DDI_USE_REGIMEN_PROMPT", "0") == "1"
+# Threads evaluating newly added pairs in the background
+BACKGROUND_WORKERS = int(os.environ.get("DDI_BACKGROUND_WORKERS", "2"))
+
+_background_pool = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="interactions")
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+# The process-wide model client. model_client pulls in requests, most of this
+# module's import time, so it is imported on the first model call rather than
+# at startup.
+def _client():
+    from model_client import get_default_client
+
+    return get_default_client()
+
+# The generated text and the prompt version of the model that wrote it (None on an error)
+def get_model_response(prompt, max_tokens=200, temperature=0.3, timeout=None):
+    response = _client().generate(prompt, max_tokens=max_tokens, temperature=temperature, timeout=timeout)
+
+    if response.status_code == 200:
+        data = response.json()
+        return data["response"], data.get("prompt_version")
+    else:
+        return f"Error: {response.status_code}, {response.text}", None
+
+# Ask the model server which verdict label is most likely for the prompt
+def get_model_classification(prompt, labels=VERDICT_LABELS, timeout=None):
+    return _client().classify(prompt, labels, timeout=timeout)
+
+# Verdict for a pair that needs no model call: a DrugBank-documented
+# interaction, or a previously cached model verdict. None if neither.
+def _known_verdict(drug1, drug2):
+    # ddi_index pulls in numpy, so it is imported on the first check rather than at startup
+    from ddi_index import get_default_index
+
+    with span("known_verdict"):
+        index = get_default_index()
+        if index is not None and index.lookup(drug1, drug2) is not None:
+            return "-1"
+        return get_default_cache().get(drug1, drug2, PROMPT_VERSION)
+
+# Verdicts for a list of pairs that need no LLM call, None where one is
+# needed: the knowledge base and cache first, then the pair classifier, which
+# scores every drug of the regimen in one matrix product and is trusted only
+# where it is confident of an interaction (or of safety, if DDI_CLASSIFIER_LOW
+# is set; see pair_classifier)
+def _screened_verdicts(pairs):
+    results = [_known_verdict(drug1, drug2) for (drug1, _), (drug2, _) in pairs]
+    unresolved = [k for k, result in enumerate(results) if result is None]
+    if not unresolved or not USE_PAIR_CLASSIFIER:
+        return results
+    # Imported here for the same reason as ddi_index
+    from pair_classifier import CLASSIFIER_HIGH, CLASSIFIER_LOW, get_default_classifier
+
+    classifier = get_default_classifier()
+    if classifier is None:
+        return results
+    with span("pair_classifier") as attrs:
+        names = []
+        for k in unresolved:
+            for drug, _ in pairs[k]:
+                if drug not in names:
+                    names.append(drug)
+        index = {name: i for i, name in enumerate(names)}
+        scores = classifier.score_matrix(names)
+        # Drugs the classifier has never seen score NaN and fail both tests
+        for k in unresolved:
+            (drug1, _), (drug2, _) = pairs[k]
+            score = scores[index[drug1], index[drug2]]
+            if score >= CLASSIFIER_HIGH:
+                results[k] = "-1"
+            elif CLASSIFIER_LOW is not None and score <= CLASSIFIER_LOW:
+                results[k] = "+1"
+        attrs["pairs"] = len(unresolved)
+        attrs["escalated"] = sum(results[k] is None for k in unresolved)
+    return results
+
+# Whether a verdict the server reported under `version` may be stored under
+# PROMPT_VERSION. After the server's default model is swapped its answers
+# carry another version; they are still shown, but never cached or saved, so
+# verdicts of two models never mix.
+def _is_current(version):
+    return version == PROMPT_VERSION
+
+# Function to check drug interactions using the Llama model. Returns
+# (verdict, current), where `current` says whether the verdict may be stored
+# (see _is_current).
+def check_drug_interaction(drug1, dosage1, drug2, dosage2, patient_info, timeout=None):
+    known = _known_verdict(drug1, drug2)
+    if known is not None:
+        return known, True
+    cache = get_default_cache()
+
+    # The pair prompt does not use patient_info yet, so it may be None
+    prompt = build_interaction_prompt(drug1, drug2)
+
+    if USE_CLASSIFIER:
+        result = get_model_classification(prompt, timeout=timeout)
+        verdict, current = result["label"], _is_current(result.get("prompt_version"))
+        if current:
+            cache.put(drug1, drug2, PROMPT_VERSION, verdict)
+        return verdict, current
+
+    # Generate response from the Llama model
+    response, version = get_model_response(prompt, max_tokens=200, temperature=0.3, timeout=timeout)
+    logger.debug("Model response", extra={"drug1": drug1, "drug2": drug2, "response": response})
+
+    with span("parse_verdict"):
+        verdict = parse_verdict(response)
+    # Only cache real verdicts so server errors and unparseable output get retried
+    current = verdict in ("+1", "-1") and _is_current(version)
+    if current:
+        cache.put(drug1, drug2, PROMPT_VERSION, verdict)
+    return verdict, current
+
+# Check a single pair, treating a timed-out or failed request as an unknown verdict
+def _check_pair(pair, patient_info, timeout):
+    # Already loaded by the model call this guards (see _client)
+    import requests
+
+    (drug1, dosage1), (drug2, dosage2) = pair
+    try:
+        return check_drug_interaction(drug1, dosage1, drug2, dosage2, patient_info, timeout=timeout)
+    except requests.RequestException as e:
+        logger.warning("Interaction check failed", extra={"drug1": drug1, "drug2": drug2, "error": str(e)})
+        return "0", False
+
+# Fetch the full pairwise verdict matrix for a drug list in a single request
+def get_interaction_matrix(drug_names, patient_info, timeout=None):
+    return _client().interaction_matrix(
+        drug_names,
+        patient_info=list(patient_info) if patient_info else None,
+        mode="classify" if USE_CLASSIFIER else "generate",
+        timeout=timeout,
+    )
+
+# Timeout for one call covering n pairs: a pair's share each, up to REGIMEN_CALL_TIMEOUT
+def _regimen_call_timeout(pair_timeout, n):
+    return min(pair_timeout * n, max(pair_timeout, REGIMEN_CALL_TIMEOUT))
+
+# Resolve every pair from the knowledge base and cache, asking the matrix
+# endpoint only about the drugs that appear in unresolved pairs. Returns
+# (verdict, current) per pair.
+def _check_pairs_via_matrix(pairs, patient_info, pair_timeout):
+    cache = get_default_cache()
+    results = [_known_verdict(drug1, drug2) for (drug1, _), (drug2, _) in pairs]
+    results = [(verdict, True) if verdict is not None else None for verdict in results]
+    missing = [k for k, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    names = []
+    for k in missing:
+        for drug, _ in pairs[k]:
+            if drug not in names:
+                names.append(drug)
+    data = get_interaction_matrix(names, patient_info, timeout=_regimen_call_timeout(pair_timeout, len(missing)))
+    index = {name: i for i, name in enumerate(names)}
+    for k in missing:
+        (drug1, _), (drug2, _) = pairs[k]
+        verdict = data["matrix"][index[drug1]][index[drug2]] or "0"
+        current = verdict in ("+1", "-1") and _is_current(data.get("prompt_version"))
+        if current:
+            cache.put(drug1, drug2, PROMPT_VERSION, verdict)
+        results[k] = (verdict, current)
+    return results
+
+# Grade the pairs with the regimen-level prompt, which covers them all in one
+# model call and only re-checks the pairs its answer missed. Returns
+# (verdict, severity, current) per pair, in order.
+def _check_pairs_via_regimen(pairs, patient_info, pair_timeout):
+    cache = get_default_cache()
+    names = []
+    for pair in pairs:
+        for drug, _ in pair:
+            if drug not in names:
+                names.append(drug)
+    data = _client().regimen(
+        names, patient_info=list(patient_info) if patient_info else None,
+        timeout=_regimen_call_timeout(pair_timeout, len(pairs)),
+    )
+    graded = {_user_pair_key(entry["drug1"], entry["drug2"]): entry for entry in data["pairs"]}
+    current = _is_current(data.get("prompt_version"))
+    results = []
+    for (drug1, _), (drug2, _) in pairs:
+        entry = graded[_user_pair_key(drug1, drug2)]
+        verdict = entry["verdict"] or "0"
+        # Regimen answers depend on the other drugs and the patient, so only
+        # the pairwise fallbacks go in the pair cache
+        if entry.get("source") == "pair" and verdict in ("+1", "-1") and current:
+            cache.put(drug1, drug2, PROMPT_VERSION, verdict)
+        results.append((verdict, entry.get("severity"), current and verdict in ("+1", "-1")))
+    return results
+
+# The details shown for an interaction; pairs nobody graded are treated as high severity
+def interaction_details(severity=None):
+    return {"severity": severity or "high", "description": "Potential conflict detected"}
+
+# Function to check drug compatibility
+# By default the whole regimen goes to the server's matrix endpoint in one call.
+# Otherwise (or if that call fails) all pairs are dispatched at once to a bounded
+# thread pool. Either way results are collected in pair order so the interaction
+# list is the same as the serial loop's.
+def check_drug_compatibility(drugs, patient_info, max_in_flight=MAX_IN_FLIGHT, pair_timeout=PAIR_TIMEOUT,
+                             use_matrix=USE_MATRIX_ENDPOINT, use_regimen=USE_REGIMEN_PROMPT):
+    # "Tylenol" and "paracetamol 500" are one drug; check it once under its canonical name
+    drugs = get_default_names().dedupe_drugs(drugs)
+    pairs = [(drugs[i], drugs[j]) for i in range(len(drugs)) for j in range(i + 1, len(drugs))]
+    results = check_drug_pairs(pairs, patient_info, max_in_flight, pair_timeout, use_matrix, use_regimen)
+
+    interactions = []
+    for ((drug1, _), (drug2, _)), (verdict, severity, _) in zip(pairs, results):
+        if verdict == "-1":
+            interactions.append((drug1, drug2, interaction_details(severity)))
+    return interactions
+
+# (verdict, severity, current) for a list of ((drug1, dosage1), (drug2, dosage2))
+# pairs, in the same order. The verdict is "+1", "-1" or "0"; the severity is
+# None unless the regimen prompt graded the pair; `current` says whether the
+# verdict may be stored under PROMPT_VERSION (see _is_current).
+def check_drug_pairs(pairs, patient_info, max_in_flight=MAX_IN_FLIGHT, pair_timeout=PAIR_TIMEOUT,
+                     use_matrix=USE_MATRIX_ENDPOINT, use_regimen=USE_REGIMEN_PROMPT):
+    import requests
+
+    results = [(verdict, None, True) if verdict is not None else None for verdict in _screened_verdicts(pairs)]
+    escalated = [k for k, result in enumerate(results) if result is None]
+    remaining = [pairs[k] for k in escalated]
+
+    if use_regimen and len(remaining) > 1:
+        try:
+            for k, result in zip(escalated, _check_pairs_via_regimen(remaining, patient_info, pair_timeout)):
+                results[k] = result
+            return results
+        except (requests.RequestException, KeyError, ValueError) as e:
+            logger.warning("Regimen endpoint unavailable, falling back to pairwise checks", extra={"error": str(e)})
+            # A regimen call that ran out of time would only time out again as a matrix call
+            use_matrix = use_matrix and not isinstance(e, requests.Timeout)
+
+    verdicts = None
+    if use_matrix and len(remaining) > 1:
+        try:
+            verdicts = _check_pairs_via_matrix(remaining, patient_info, pair_timeout)
+        except (requests.RequestException, KeyError, IndexError, ValueError) as e:
+            logger.warning("Matrix endpoint unavailable, falling back to per-pair checks", extra={"error": str(e)})
+
+    if verdicts is None and (max_in_flight <= 1 or len(remaining) <= 1):
+        verdicts = [_check_pair(pair, patient_info, pair_timeout) for pair in remaining]
+    elif verdicts is None:
+        with ThreadPoolExecutor(max_workers=min(max_in_flight, len(remaining))) as pool:
+            check = bind(_check_pair)
+            verdicts = list(pool.map(lambda pair: check(pair, patient_info, pair_timeout), remaining))
+    for k, (verdict, current) in zip(escalated, verdicts):
+        results[k] = (verdict, None, current)
+    return results
+
+# Like check_drug_pairs, but yields (pair, verdict, severity, current) as each verdict
+# is known instead of in pair order. Pairs answered by the knowledge base, the
+# cache or the pair classifier come out first, warnings before the rest,
+# before any model call is made. The remaining pairs come from the regimen
+# prompt (all at once, warnings first) if enabled, else stream from the
+# server's interactions endpoint, or from the per-pair checks if neither is
+# available.
+def stream_drug_pairs(pairs, patient_info, max_in_flight=MAX_IN_FLIGHT, pair_timeout=PAIR_TIMEOUT,
+                      use_stream=USE_MATRIX_ENDPOINT, use_regimen=USE_REGIMEN_PROMPT):
+    import requests
+
+    known = list(zip(pairs, _screened_verdicts(pairs)))
+    for pair, verdict in sorted((item for item in known if item[1] is not None), key=lambda item: item[1] != "-1"):
+        yield pair, verdict, None, True
+    missing = {_user_pair_key(pair[0][0], pair[1][0]): pair for pair, verdict in known if verdict is None}
+
+    if use_regimen and len(missing) > 1:
+        remaining = list(missing.values())
+        try:
+            results = _check_pairs_via_regimen(remaining, patient_info, pair_timeout)
+        except (requests.RequestException, KeyError, ValueError) as e:
+            logger.warning("Regimen endpoint unavailable, falling back to pairwise checks", extra={"error": str(e)})
+        else:
+            for pair, (verdict, severity, current) in sorted(zip(remaining, results), key=lambda item: item[1][0] != "-1"):
+                yield pair, verdict, severity, current
+            return
+
+    if use_stream and len(missing) > 1:
+        try:
+            yield from _stream_pairs_from_server(missing, patient_info, pair_timeout)
+        except (requests.RequestException, KeyError, ValueError) as e:
+            logger.warning("Streaming endpoint unavailable, falling back to per-pair checks", extra={"error": str(e)})
+    if not missing:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(missing)))) as pool:
+        futures = {pool.submit(bind(_check_pair), pair, patient_info, pair_timeout): pair for pair in missing.values()}
+        for future in as_completed(futures):
+            verdict, current = future.result()
+            yield futures[future], verdict, None, current
+
+# Yield (pair, verdict, None, current) from the server's streaming endpoint, removing each
+# answered pair from `missing` so a broken stream can be finished elsewhere
+def _stream_pairs_from_server(missing, patient_info, pair_timeout):
+    cache = get_default_cache()
+    names = []
+    for pair in missing.values():
+        for drug, _ in pair:
+            if drug not in names:
+                names.append(drug)
+    lines = _client().stream_interactions(
+        names,
+        patient_info=list(patient_info) if patient_info else None,
+        mode="classify" if USE_CLASSIFIER else "generate",
+        timeout=pair_timeout,
+    )
+    for line in lines:
+        if line.get("done"):
+            break
+        pair = missing.pop(_user_pair_key(line["drug1"], line["drug2"]), None)
+        if pair is None:
+            continue
+        verdict = line["verdict"] or "0"
+        current = verdict in ("+1", "-1") and _is_current(line.get("prompt_version"))
+        if current:
+            cache.put(pair[0][0], pair[1][0], PROMPT_VERSION, verdict)
+        yield pair, verdict, None, current
+
+# Key of a pair in the interactions table: both normalized names, sorted
+def _user_pair_key(drug1, drug2):
+    return tuple(sorted((normalize_drug(drug1), normalize_drug(drug2))))
+
+# Every pair of a user's drugs, under their canonical names
+def _user_pairs(username):
+    drugs = get_default_names().dedupe_drugs(get_user_drugs(username))
+    return [(drugs[i], drugs[j]) for i in range(len(drugs)) for j in range(i + 1, len(drugs))]
+
+# Mark the user's pairs that have no stored verdict from the current model and
+# are not already being checked as in flight, and return them
+def _claim_user_pairs(username):
+    stored = get_user_interactions(username, PROMPT_VERSION)
+    claimed = []
+    with _in_flight_lock:
+        for pair in _user_pairs(username):
+            key = _user_pair_key(pair[0][0], pair[1][0])
+            if key in stored or (username, key) in _in_flight:
+                continue
+            _in_flight.add((username, key))
+            claimed.append(pair)
+    return claimed
+
+def _release_user_pairs(username, pairs):
+    with _in_flight_lock:
+        for (drug1, _), (drug2, _) in pairs:
+            _in_flight.discard((username, _user_pair_key(drug1, drug2)))
+
+# Queue background checks for the user's unchecked pairs. After adding one
+# drug to n others that is the n new pairs only. Returns how many were queued.
+def schedule_user_pairs(username):
+    queued = _claim_user_pairs(username)
+    if queued:
+        _background_pool.submit(_evaluate_user_pairs, username, queued)
+    return len(queued)
+
+# Check the user's unchecked pairs in the calling thread, storing and yielding
+# (drug1, drug2, verdict, severity) as each verdict arrives
+def stream_user_pairs(username):
+    pairs = _claim_user_pairs(username)
+    try:
+        patient_info = get_user_profile(username)
+        for ((drug1, _), (drug2, _)), verdict, severity, current in stream_drug_pairs(pairs, patient_info):
+            # A profile edit while the checks ran makes these verdicts stale
+            if current and verdict in ("+1", "-1") and get_user_profile(username) == patient_info:
+                save_user_interactions(username, [_user_pair_key(drug1, drug2) + (verdict, severity)], PROMPT_VERSION)
+            yield drug1, drug2, verdict, severity
+    finally:
+        _release_user_pairs(username, pairs)
+
+def _evaluate_user_pairs(username, pairs):
+    try:
+        with trace("background_check"):
+            _save_user_verdicts(username, pairs)
+    except Exception:
+        logger.exception("Background interaction check failed", extra={"username": username})
+    finally:
+        _release_user_pairs(username, pairs)
+
+def _save_user_verdicts(username, pairs):
+    patient_info = get_user_profile(username)
+    results = check_drug_pairs(pairs, patient_info)
+    rows = [
+        _user_pair_key(drug1, drug2) + (verdict, severity)
+        for ((drug1, _), (drug2, _)), (verdict, severity, current) in zip(pairs, results)
+        if current and verdict in ("+1", "-1")
+    ]
+    # A profile edit while the checks ran makes these verdicts stale
+    if rows and get_user_profile(username) == patient_info:
+        save_user_interactions(username, rows, PROMPT_VERSION)
+
+# The user's precomputed interactions, in the form check_drug_compatibility
+# returns, and the number of pairs that have no verdict yet
+def get_user_matrix(username):
+    stored = get_user_interactions(username, PROMPT_VERSION)
+    interactions, pending = [], 0
+    for (drug1, _), (drug2, _) in _user_pairs(username):
+        verdict, severity = stored.get(_user_pair_key(drug1, drug2), (None, None))
+        if verdict is None:
+            pending += 1
+        elif verdict == "-1":
+            interactions.append((drug1, drug2, interaction_details(severity)))
+    return interactions, pending
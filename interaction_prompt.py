@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import re
+
+from interaction_cache import normalize_drug
+
+# Prompt used for every pairwise check
+INTERACTION_PROMPT = """
+    You are a medical AI that checks drug interactions. 
+    Please only output either "+1" if the drugs are safe together or "-1" if there is a conflict.
+    Do not provide any other text.
+
+    Drug 1: {drug1}
+    Drug 2: {drug2}
+
+    MAKE SURE YOUR OUTPUT CONTAINS A "+1" if there is no conflict OR "-1" if there is a conflict or if one or two of the drugs are unsafe.
+    """
+
+# Shared instruction block that precedes the drug-specific lines; the model
+# server keeps its evaluated state so only the rest of the prompt is processed
+INTERACTION_PREFIX = INTERACTION_PROMPT[:INTERACTION_PROMPT.index("{drug1}")].rsplit("\n", 1)[0] + "\n"
+
+# Model served behind the API; together with the prompt this versions cached verdicts
+MODEL_NAME = os.environ.get("DDI_MODEL_NAME", "Llama-3.2-1B-Instruct-Q4_0")
+
+# Outputs the model is allowed to give when run as a classifier
+VERDICT_LABELS = ("+1", "-1")
+
+# Severities the regimen prompt grades interactions with; the graph colors edges by them
+SEVERITY_LABELS = ("high", "moderate", "mild", "none")
+
+# Prompt for checking a whole regimen at once, answered as a JSON array with
+# one entry per listed pair
+REGIMEN_PROMPT = """
+    You are a medical AI that checks drug interactions.
+    For every pair of drugs listed below, decide whether they are safe together for this patient.
+    Answer with a JSON array only, one object per pair:
+    {{"drug1": ..., "drug2": ..., "verdict": "+1" if safe or "-1" if there is a conflict, "severity": "high", "moderate", "mild" or "none"}}
+
+    Patient: {patient}
+
+    Drugs: {drugs}
+
+    Pairs to check:
+{pairs}
+    """
+
+PATIENT_FIELDS = ("Height (cm)", "Weight (kg)", "Comorbidities", "Route", "Gender", "Substance Use")
+
+
+# Every verdict source (pair prompt, classifier labels, regimen prompt and its
+# severities) goes into the version, so changing any of them retires the
+# verdicts cached or stored under the old one
+def prompt_version(model_name):
+    parts = [model_name, INTERACTION_PROMPT, REGIMEN_PROMPT, "|".join(VERDICT_LABELS), "|".join(SEVERITY_LABELS)]
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()[:12]
+
+
+PROMPT_VERSION = prompt_version(MODEL_NAME)
+
+# Build the prompt for a single drug pair
+def build_interaction_prompt(drug1, drug2):
+    return INTERACTION_PROMPT.format(drug1=drug1, drug2=drug2)
+
+# A user profile row (see db.get_user_profile) as one line of the prompt
+def format_patient_info(patient_info):
+    if not patient_info:
+        return "Not provided"
+    fields = [f"{label}: {value}" for label, value in zip(PATIENT_FIELDS, patient_info) if value not in (None, "")]
+    return ", ".join(fields) or "Not provided"
+
+# The regimen prompt for `pairs` of the drugs (every pair by default); the
+# whole drug list is always shown, so a part of the regimen keeps its context
+def build_regimen_prompt(drugs, patient_info, pairs=None):
+    if pairs is None:
+        pairs = [(drugs[i], drugs[j]) for i in range(len(drugs)) for j in range(i + 1, len(drugs))]
+    return REGIMEN_PROMPT.format(
+        patient=format_patient_info(patient_info),
+        drugs=", ".join(drugs),
+        pairs="\n".join(f"    - {drug1} + {drug2}" for drug1, drug2 in pairs),
+    )
+
+# JSON schema the regimen answer is constrained to (as a llama.cpp grammar):
+# drug names from the regimen and the allowed verdicts and severities only
+def regimen_schema(drugs):
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "drug1": {"enum": list(drugs)},
+                "drug2": {"enum": list(drugs)},
+                "verdict": {"enum": list(VERDICT_LABELS)},
+                "severity": {"enum": list(SEVERITY_LABELS)},
+            },
+            "required": ["drug1", "drug2", "verdict", "severity"],
+        },
+    }
+
+# The entries of a JSON array, decoded one object at a time, so an answer cut
+# off at max_tokens still yields every entry before the cut
+def _iter_array_entries(output_text):
+    decoder = json.JSONDecoder()
+    position = output_text.find("[")
+    if position == -1:
+        return
+    position += 1
+    while True:
+        while position < len(output_text) and output_text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(output_text) or output_text[position] == "]":
+            return
+        try:
+            entry, position = decoder.raw_decode(output_text, position)
+        except ValueError:
+            return
+        yield entry
+
+# Validated {(name1, name2): (verdict, severity)} from the regimen answer, for
+# the requested (name1, name2) pairs only. Entries for other pairs and entries
+# with a bad verdict or severity are dropped; a pair answered twice with
+# different results is dropped too. The caller re-checks whatever is missing
+# on its own. A conflict graded "none" is taken as the mildest severity.
+def parse_regimen_verdicts(output_text, pairs):
+    requested = {tuple(sorted((normalize_drug(a), normalize_drug(b)))): (a, b) for a, b in pairs}
+    verdicts, conflicting = {}, set()
+    for entry in _iter_array_entries(output_text):
+        if not isinstance(entry, dict):
+            continue
+        names = (normalize_drug(str(entry.get("drug1"))), normalize_drug(str(entry.get("drug2"))))
+        pair = requested.get(tuple(sorted(names)))
+        verdict = str(entry.get("verdict")).strip()
+        verdict = {"1": "+1", "+1": "+1", "-1": "-1"}.get(verdict)
+        severity = str(entry.get("severity")).strip().lower()
+        if pair is None or verdict is None or severity not in SEVERITY_LABELS:
+            continue
+        if verdict == "+1":
+            # A safe pair has nothing to grade
+            severity = "none"
+        elif severity == "none":
+            severity = "mild"
+        if verdicts.get(pair, (verdict, severity)) != (verdict, severity):
+            conflicting.add(pair)
+        verdicts[pair] = (verdict, severity)
+    for pair in conflicting:
+        del verdicts[pair]
+    return verdicts
+
+# Turn the model's free-text answer into "+1", "-1" or "0"
+def parse_verdict(output_text):
+    # count the number of +1s and -1s in the response
+    plus_ones = output_text.count("+1")
+    minus_ones = output_text.count("-1")
+
+    if "not safe" in output_text or "unsafe" in output_text:
+        return "-1"
+    
+    if "conflict" in output_text:
+        return "-1"
+
+    if(plus_ones > 0 and plus_ones > minus_ones and minus_ones > 0):
+        return "+1"
+
+    if(minus_ones > 0 and minus_ones > plus_ones and plus_ones > 0):
+        return "-1"
+    
+    if "-1" in output_text:
+        return "-1"
+    elif re.search(r'\b1\b', output_text.replace('\n', ' ').replace(' ', '')):
+        return "+1"
+    else:
+        return "0"
@@ -0,0 +1,159 @@
+import threading
+
+# Minimal Prometheus text-format metrics for the model server
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    # `function`, if given, is called at scrape time for the (unlabelled) value
+    def __init__(self, name, documentation, labelnames=(), registry=None, function=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.function is not None:
+            return [f"{self.name} {self.function()}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+            counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    # Every registered metric in the Prometheus text exposition format
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# Model server metrics
+requests_total = Counter("ddi_requests_total", "HTTP requests served.", ["path", "status"])
+request_seconds = Histogram("ddi_request_seconds", "HTTP request latency in seconds.", ["path"])
+in_flight_requests = Gauge("ddi_in_flight_requests", "HTTP requests currently being served.")
+inference_total = Counter("ddi_inference_total", "Inference tasks completed.", ["model", "task", "outcome"])
+queue_wait_seconds = Histogram("ddi_queue_wait_seconds", "Time from submission until a worker starts the task.", ["model", "task"])
+prompt_eval_seconds = Histogram("ddi_prompt_eval_seconds", "Time spent evaluating the prompt.", ["model", "task"])
+generation_seconds = Histogram("ddi_generation_seconds", "Time spent generating or scoring output tokens.", ["model", "task"])
+prompt_tokens_total = Counter("ddi_prompt_tokens_total", "Prompt tokens processed.", ["model", "task"])
+completion_tokens_total = Counter("ddi_completion_tokens_total", "Completion tokens generated.", ["model", "task"])
+tokens_per_second = Histogram(
+    "ddi_tokens_per_second", "Prompt plus completion tokens per second of worker time, per task.", ["model", "task"],
+    buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+
+
+# Record the timings a scheduler worker reported for one task
+def record_inference(model, task, ok, timings):
+    inference_total.inc(model=model, task=task, outcome="ok" if ok else "error")
+    if not timings:
+        return
+    if "queue_wait" in timings:
+        queue_wait_seconds.observe(timings["queue_wait"], model=model, task=task)
+    prompt_eval = timings.get("prompt_eval", 0.0)
+    generation = timings.get("generation", 0.0)
+    prompt_eval_seconds.observe(prompt_eval, model=model, task=task)
+    generation_seconds.observe(generation, model=model, task=task)
+    tokens = timings.get("prompt_tokens", 0) + timings.get("completion_tokens", 0)
+    prompt_tokens_total.inc(timings.get("prompt_tokens", 0), model=model, task=task)
+    completion_tokens_total.inc(timings.get("completion_tokens", 0), model=model, task=task)
+    if prompt_eval + generation > 0:
+        tokens_per_second.observe(tokens / (prompt_eval + generation), model=model, task=task)
@@ -0,0 +1,234 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tracing import span
+
+MODEL_API_URL = os.environ.get("DDI_MODEL_API_URL", "https://81d9-76-183-140-135.ngrok-free.app")
+CONNECT_TIMEOUT = float(os.environ.get("DDI_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.environ.get("DDI_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.environ.get("DDI_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.environ.get("DDI_BACKOFF_BASE", "0.25"))
+BACKOFF_MAX = float(os.environ.get("DDI_BACKOFF_MAX", "4"))
+POOL_SIZE = int(os.environ.get("DDI_POOL_SIZE", "16"))
+BREAKER_THRESHOLD = int(os.environ.get("DDI_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("DDI_BREAKER_COOLDOWN", "30"))
+# Scheduling lane on the model server: "interactive" or "batch"
+REQUEST_PRIORITY = os.environ.get("DDI_REQUEST_PRIORITY", "interactive")
+
+
+# Raised without touching the network while the breaker is open. Subclasses
+# ConnectionError so callers that already handle requests errors keep working.
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `cooldown` seconds. After the cooldown one trial call is let through;
+    its outcome closes the breaker again or re-opens it.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class ModelClient:
+    """
+    HTTP client for the model server: one keep-alive session with a bounded
+    connection pool, connect/read timeouts, jittered exponential backoff on
+    5xx responses and connection errors, a circuit breaker, and a rolling
+    window of per-call latencies. Every call tells the server its priority
+    lane and its read timeout, so the server can drop work nobody will wait
+    for; a 429 or 503 is retried after the server's Retry-After (capped at
+    BACKOFF_MAX) without counting against the breaker.
+    """
+
+    def __init__(self, base_url=MODEL_API_URL, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, pool_size=POOL_SIZE, breaker=None, priority=REQUEST_PRIORITY):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.priority = priority
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = deque(maxlen=1000)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def _retry_after(self, response, attempt):
+        try:
+            return min(BACKOFF_MAX, float(response.headers["Retry-After"]))
+        except (KeyError, ValueError):
+            return self._backoff(attempt)
+
+    # POST a JSON payload to `path`. Returns the final response, which may
+    # still be a 5xx or 429 once retries run out. Read timeouts and 504s are
+    # not retried: the call's time budget is already spent. With
+    # `stream` the body is left unread, for endpoints that send results
+    # incrementally.
+    def post(self, path, payload, timeout=None, stream=False):
+        url = f"{self.base_url}{path}"
+        read_timeout = timeout if timeout is not None else self.read_timeout
+        headers = {"X-Priority": self.priority}
+        if not stream:
+            # A stream's timeout bounds the gap between lines, not the whole call
+            headers["X-Request-Timeout"] = str(read_timeout)
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Model server circuit is open; not calling {url}")
+
+            start = time.perf_counter()
+            try:
+                with span(f"model {path}", attempt=attempt) as attrs:
+                    response = self.session.post(
+                        url, json=payload, headers=headers, timeout=(self.connect_timeout, read_timeout), stream=stream
+                    )
+                    attrs["status"] = response.status_code
+            except requests.ConnectionError:
+                self.latencies.append((path, time.perf_counter() - start, None))
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            except requests.Timeout:
+                self.latencies.append((path, time.perf_counter() - start, None))
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Any other error still has to settle a half-open trial
+                self.breaker.record_failure()
+                raise
+
+            self.latencies.append((path, time.perf_counter() - start, response.status_code))
+            if response.status_code in (429, 503):
+                # The server is up but full, or still loading: back off as it asks
+                self.breaker.record_success()
+                if attempt == self.max_retries:
+                    return response
+                # Hand the connection back to the pool before waiting (a
+                # streamed body is otherwise left unread and holds it)
+                response.close()
+                time.sleep(self._retry_after(response, attempt))
+                continue
+            if response.status_code < 500:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+            # The server gave up at our deadline; a retry could not finish in time either
+            if response.status_code == 504 or attempt == self.max_retries:
+                return response
+            response.close()
+            time.sleep(self._backoff(attempt))
+
+    # `model` picks one of the server's models; None means its current default
+    def generate(self, prompt, max_tokens=200, temperature=0.3, timeout=None, model=None):
+        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "model": model}
+        return self.post("/generate/", payload, timeout=timeout)
+
+    def classify(self, prompt, labels, timeout=None, model=None):
+        response = self.post("/classify/", {"prompt": prompt, "labels": list(labels), "model": model}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def interaction_matrix(self, drugs, patient_info=None, mode="classify", timeout=None, model=None):
+        payload = {"drugs": list(drugs), "patient_info": patient_info, "mode": mode, "model": model}
+        response = self.post("/interactions/matrix", payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    # Every pair of the regimen graded from one prompt that includes the patient profile
+    def regimen(self, drugs, patient_info=None, timeout=None, model=None):
+        payload = {"drugs": list(drugs), "patient_info": patient_info, "model": model}
+        response = self.post("/interactions/regimen", payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    # Yield one dict per pair from the streaming interactions endpoint as the
+    # server finishes it. `timeout` bounds the wait between lines, not the total.
+    def stream_interactions(self, drugs, patient_info=None, mode="classify", timeout=None, model=None):
+        payload = {"drugs": list(drugs), "patient_info": patient_info, "mode": mode, "model": model}
+        response = self.post("/interactions/stream", payload, timeout=timeout, stream=True)
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    # p50/p95/max latency in seconds over the recorded window, per path
+    def latency_summary(self):
+        by_path = {}
+        for path, seconds, _ in list(self.latencies):
+            by_path.setdefault(path, []).append(seconds)
+        summary = {}
+        for path, values in by_path.items():
+            values.sort()
+            summary[path] = {
+                "count": len(values),
+                "p50": values[len(values) // 2],
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+                "max": values[-1],
+            }
+        return summary
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+# Process-wide client so the connection pool survives Streamlit reruns
+def get_default_client():
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = ModelClient()
+        return _default_client
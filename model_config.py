@@ -0,0 +1,48 @@
+import json
+import os
+
+from interaction_prompt import MODEL_NAME
+
+# Model file and llama.cpp load options for the model server
+MODEL_PATH = os.environ.get("DDI_MODEL_PATH", os.path.join("models", "Llama-3.2-1B-Instruct-Q4_0.gguf"))
+N_CTX = int(os.environ.get("DDI_MODEL_N_CTX", "2048"))
+N_GPU_LAYERS = int(os.environ.get("DDI_MODEL_N_GPU_LAYERS", "0"))
+# Map the weights instead of reading them in, so loading is lazy and the page
+# cache is shared by every worker process on the machine
+USE_MMAP = os.environ.get("DDI_MODEL_USE_MMAP", "1") == "1"
+USE_MLOCK = os.environ.get("DDI_MODEL_USE_MLOCK", "0") == "1"
+# Generated once (one token) by each worker after loading, before it reports ready
+WARMUP_PROMPT = os.environ.get("DDI_WARMUP_PROMPT", "")
+# Optional JSON file declaring several models, e.g.
+#   {"default": "llama-1b",
+#    "models": {"llama-1b": {"path": "models/llama-1b.gguf"},
+#               "llama-3b": {"path": "models/llama-3b.gguf", "n_ctx": 4096, "workers": 1, "preload": false}}}
+# Each model takes the options below (path, n_ctx, n_gpu_layers, use_mmap,
+# use_mlock, warmup_prompt) plus "workers" and "preload". Without the file
+# there is one model, named DDI_MODEL_NAME, configured by the variables above.
+MODELS_CONFIG = os.environ.get("DDI_MODELS_CONFIG")
+
+
+# The default model's name and {name: options} for every declared model
+def load_models(path=MODELS_CONFIG):
+    if not path:
+        return MODEL_NAME, {MODEL_NAME: {"path": MODEL_PATH, "preload": True}}
+    with open(path) as f:
+        data = json.load(f)
+    models = data["models"]
+    default = data.get("default") or next(iter(models))
+    if default not in models:
+        raise ValueError(f"Default model {default!r} is not declared in {path}")
+    return default, models
+
+
+# llama.cpp keyword arguments for a model, falling back to the variables above
+def model_kwargs(options=None):
+    options = options or {}
+    return {
+        "n_ctx": options.get("n_ctx", N_CTX),
+        "n_gpu_layers": options.get("n_gpu_layers", N_GPU_LAYERS),
+        "use_mmap": options.get("use_mmap", USE_MMAP),
+        "use_mlock": options.get("use_mlock", USE_MLOCK),
+        "verbose": False,
+    }
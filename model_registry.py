@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import model_config
+from scheduler import NUM_WORKERS, InferenceScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotFound(KeyError):
+    pass
+
+
+class ModelEntry:
+    def __init__(self, name, scheduler):
+        self.name = name
+        self.scheduler = scheduler
+        self.in_flight = 0
+        self.loaded_at = time.time()
+
+
+class ModelRegistry:
+    """
+    The models the server can run, each served by its own InferenceScheduler.
+    Requests name a model or get the current default. Every request holds its
+    model's entry for as long as it runs, so unloading a model (or swapping
+    the default and retiring the old one) first takes it out of the lookup
+    table and then waits for the requests already on it to drain. The
+    default is a single name swapped under the lock, so a request sees
+    either the old model or the new one, never a mix.
+
+    Workers load weights with mmap (see model_config), so worker processes
+    running the same file share its pages through the page cache.
+    """
+
+    def __init__(self, specs, default, prefixes=(), observer=None):
+        self.specs = dict(specs)
+        self.default = default
+        self.prefixes = list(prefixes)
+        # Called as observer(model, task, ok, timings)
+        self.observer = observer
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+
+    @classmethod
+    def from_config(cls, path=model_config.MODELS_CONFIG, **kwargs):
+        default, specs = model_config.load_models(path)
+        return cls(specs, default, **kwargs)
+
+    def _build(self, name):
+        spec = self.specs[name]
+        observer = None
+        if self.observer is not None:
+            def observer(task, ok, timings):
+                self.observer(name, task, ok, timings)
+        return InferenceScheduler(
+            spec["path"],
+            num_workers=spec.get("workers", NUM_WORKERS),
+            model_kwargs=model_config.model_kwargs(spec),
+            prefixes=self.prefixes,
+            observer=observer,
+            warmup_prompt=spec.get("warmup_prompt", model_config.WARMUP_PROMPT) or None,
+        )
+
+    # Start loading a declared model in the background; a no-op if it is loaded
+    def load(self, name):
+        with self._lock:
+            if name not in self.specs:
+                raise ModelNotFound(name)
+            entry = self._entries.get(name)
+            if entry is not None:
+                return entry
+            entry = self._entries[name] = ModelEntry(name, self._build(name))
+        entry.scheduler.start()
+        logger.info("Loading model", extra={"model": name, "model_path": self.specs[name]["path"]})
+        return entry
+
+    # Load the default model and every model marked "preload"
+    def load_configured(self):
+        for name, spec in self.specs.items():
+            if name == self.default or spec.get("preload"):
+                self.load(name)
+
+    # Take a model out of service, wait up to `timeout` seconds for its
+    # in-flight requests to finish, then stop its workers. Blocks; run it off
+    # the event loop.
+    def unload(self, name, timeout=60):
+        with self._lock:
+            if name == self.default:
+                raise ValueError(f"{name} is the default model; make another model the default first.")
+            entry = self._entries.pop(name, None)
+            if entry is None:
+                raise ModelNotFound(name)
+            deadline = time.monotonic() + timeout
+            while entry.in_flight and time.monotonic() < deadline:
+                self._drained.wait(deadline - time.monotonic())
+            abandoned = entry.in_flight
+        entry.scheduler.stop()
+        logger.info("Unloaded model", extra={"model": name, "abandoned_requests": abandoned})
+        return abandoned
+
+    # Make a loaded, ready model the default; returns the previous default
+    def set_default(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                raise ModelNotFound(name)
+            if not entry.scheduler.ready:
+                raise ValueError(f"Model {name} is {entry.scheduler.status}.")
+            previous, self.default = self.default, name
+        logger.info("Default model changed", extra={"model": name, "previous": previous})
+        return previous
+
+    # Hold a model (the default if `name` is None) for the duration of a request
+    @contextmanager
+    def acquire(self, name=None):
+        with self._lock:
+            name = name or self.default
+            entry = self._entries.get(name)
+            if entry is None:
+                raise ModelNotFound(name)
+            entry.in_flight += 1
+        try:
+            yield entry.scheduler
+        finally:
+            with self._lock:
+                entry.in_flight -= 1
+                if not entry.in_flight:
+                    self._drained.notify_all()
+
+    def get(self, name=None):
+        with self._lock:
+            entry = self._entries.get(name or self.default)
+        return entry.scheduler if entry is not None else None
+
+    def schedulers(self):
+        with self._lock:
+            return [entry.scheduler for entry in self._entries.values()]
+
+    def stats(self):
+        with self._lock:
+            entries = dict(self._entries)
+            default = self.default
+        models = {}
+        for name, spec in self.specs.items():
+            entry = entries.get(name)
+            models[name] = {"path": spec["path"], "loaded": entry is not None}
+            if entry is not None:
+                models[name].update(entry.scheduler.stats(), in_flight=entry.in_flight, loaded_at=entry.loaded_at)
+        return {"default": default, "models": models}
+
+    def stop_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.scheduler.stop()
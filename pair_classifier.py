@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from ddi_index import load_csv_rows, load_tdc_rows
+from drug_names import get_default_names, load_vocabulary
+from interaction_cache import normalize_drug
+
+# Base path of the trained model: <base>.embeddings.npy, <base>.weights.npy,
+# <base>.bias.npy and <base>.ids.json
+PAIR_CLASSIFIER_PATH = os.environ.get("DDI_PAIR_CLASSIFIER_PATH", os.path.join("data", "pair_classifier"))
+# Pairs scored at or above HIGH are reported as interactions without asking
+# the LLM. The negatives the model trains on are pairs DrugBank does not
+# list, which is not the same as safe, so a low score only settles a pair as
+# safe if DDI_CLASSIFIER_LOW is set; by default every other pair goes to the LLM.
+CLASSIFIER_LOW = float(os.environ["DDI_CLASSIFIER_LOW"]) if os.environ.get("DDI_CLASSIFIER_LOW") else None
+CLASSIFIER_HIGH = float(os.environ.get("DDI_CLASSIFIER_HIGH", "0.95"))
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -30, 30)))
+
+
+class PairClassifier:
+    """
+    Logistic matrix factorization over drugs: every drug is a row of a dense
+    embedding matrix plus a bias, and the probability that two drugs interact
+    is sigmoid(sum_k w_k e_ik e_jk + b_i + b_j + c). The per-dimension weights
+    w may be negative, so drugs that do not interact with each other can
+    still share partners (an inhibitor and the drugs it slows down). A
+    regimen of k drugs is scored by one k x d by d x k product, so all of its
+    pairs come out of a single matrix operation.
+    """
+
+    def __init__(self, base_path=PAIR_CLASSIFIER_PATH):
+        self.embeddings = np.load(f"{base_path}.embeddings.npy", mmap_mode="r")
+        self.weights = np.load(f"{base_path}.weights.npy")
+        bias = np.load(f"{base_path}.bias.npy")
+        self.bias, self.offset = bias[:-1], float(bias[-1])
+        with open(f"{base_path}.ids.json") as f:
+            self.ids = json.load(f)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def drug_id(self, name):
+        drug_id = self.ids.get(normalize_drug(name))
+        if drug_id is None:
+            resolved = get_default_names().resolve(name)
+            if resolved is not None:
+                drug_id = self.ids.get(normalize_drug(resolved))
+        return drug_id
+
+    # k x k interaction probabilities for k drug names; rows and columns of
+    # drugs the model has never seen are NaN
+    def score_matrix(self, names):
+        ids = [self.drug_id(name) for name in names]
+        known = np.array([drug_id is not None for drug_id in ids])
+        rows = np.array([drug_id if drug_id is not None else 0 for drug_id in ids], dtype=np.int64)
+        vectors = np.asarray(self.embeddings[rows], dtype=np.float32)
+        bias = self.bias[rows]
+        probabilities = _sigmoid((vectors * self.weights) @ vectors.T + bias[:, None] + bias[None, :] + self.offset)
+        probabilities[~known, :] = np.nan
+        probabilities[:, ~known] = np.nan
+        return probabilities
+
+
+# Positive pairs as sorted keys, to tell sampled negatives from known interactions
+def _pair_keys(pairs, num_drugs):
+    return np.minimum(pairs[:, 0], pairs[:, 1]) * num_drugs + np.maximum(pairs[:, 0], pairs[:, 1])
+
+
+# Fit drug embeddings to known interacting pairs (label 1) against randomly
+# drawn pairs not in the data (label 0). Returns (embeddings, weights, bias, offset).
+def train(pairs, num_drugs, dim=32, epochs=10, batch_size=4096, learning_rate=0.05, l2=1e-5,
+          negatives=1, seed=0, log=print):
+    rng = np.random.default_rng(seed)
+    pairs = np.asarray(pairs, dtype=np.int64)
+    positive_keys = np.unique(_pair_keys(pairs, num_drugs))
+
+    embeddings = rng.normal(0, 0.1, size=(num_drugs, dim)).astype(np.float32)
+    weights = rng.choice([-1.0, 1.0], size=dim).astype(np.float32)
+    bias = np.zeros(num_drugs, dtype=np.float32)
+    offset = 0.0
+    # Adagrad accumulators, so rare drugs still move
+    embeddings_g2 = np.full_like(embeddings, 1e-8)
+    weights_g2 = np.full_like(weights, 1e-8)
+    bias_g2 = np.full_like(bias, 1e-8)
+    offset_g2 = 1e-8
+
+    for epoch in range(epochs):
+        sampled = rng.integers(0, num_drugs, size=(len(pairs) * negatives, 2))
+        sampled = sampled[(sampled[:, 0] != sampled[:, 1]) & ~np.isin(_pair_keys(sampled, num_drugs), positive_keys)]
+        left = np.concatenate([pairs[:, 0], sampled[:, 0]])
+        right = np.concatenate([pairs[:, 1], sampled[:, 1]])
+        labels = np.concatenate([np.ones(len(pairs), np.float32), np.zeros(len(sampled), np.float32)])
+        order = rng.permutation(len(labels))
+        total_loss = 0.0
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            i, j, y = left[batch], right[batch], labels[batch]
+            ei, ej = embeddings[i], embeddings[j]
+            p = _sigmoid((ei * weights * ej).sum(axis=1) + bias[i] + bias[j] + offset)
+            total_loss -= float(np.sum(y * np.log(p + 1e-7) + (1 - y) * np.log(1 - p + 1e-7)))
+
+            error = (p - y)[:, None]
+            grad_i = error * weights * ej + l2 * ei
+            grad_j = error * weights * ei + l2 * ej
+            grad_weights = (error * ei * ej).sum(axis=0)
+            grad_embeddings = np.zeros_like(embeddings)
+            np.add.at(grad_embeddings, i, grad_i)
+            np.add.at(grad_embeddings, j, grad_j)
+            grad_bias = np.zeros_like(bias)
+            np.add.at(grad_bias, i, error[:, 0])
+            np.add.at(grad_bias, j, error[:, 0])
+            grad_offset = float(error.sum())
+
+            embeddings_g2 += grad_embeddings ** 2
+            weights_g2 += grad_weights ** 2
+            bias_g2 += grad_bias ** 2
+            offset_g2 += grad_offset ** 2
+            embeddings -= learning_rate * grad_embeddings / np.sqrt(embeddings_g2)
+            weights -= learning_rate * grad_weights / np.sqrt(weights_g2)
+            bias -= learning_rate * grad_bias / np.sqrt(bias_g2)
+            offset -= learning_rate * grad_offset / np.sqrt(offset_g2)
+
+        log(f"epoch {epoch + 1}/{epochs}: loss {total_loss / len(labels):.4f}")
+    return embeddings, weights, bias, offset
+
+
+# ROC AUC from the rank of the positive scores
+def _auc(scores, labels):
+    ranks = np.empty(len(scores))
+    ranks[np.argsort(scores, kind="stable")] = np.arange(1, len(scores) + 1)
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    return float((ranks[labels == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+# AUC on held-out pairs against random pairs outside `known`, and how many
+# of them the thresholds settle and how accurately (`low` None: HIGH only)
+def evaluate(embeddings, weights, bias, offset, pairs, known, num_drugs, low=CLASSIFIER_LOW, high=CLASSIFIER_HIGH,
+             seed=1):
+    rng = np.random.default_rng(seed)
+    pairs = np.asarray(pairs, dtype=np.int64)
+    sampled = rng.integers(0, num_drugs, size=(len(pairs), 2))
+    known_keys = _pair_keys(np.asarray(known, dtype=np.int64), num_drugs)
+    sampled = sampled[(sampled[:, 0] != sampled[:, 1]) & ~np.isin(_pair_keys(sampled, num_drugs), known_keys)]
+    left = np.concatenate([pairs[:, 0], sampled[:, 0]])
+    right = np.concatenate([pairs[:, 1], sampled[:, 1]])
+    labels = np.concatenate([np.ones(len(pairs)), np.zeros(len(sampled))])
+    scores = _sigmoid((embeddings[left] * weights * embeddings[right]).sum(axis=1) + bias[left] + bias[right] + offset)
+    settled_safe = scores <= low if low is not None else np.zeros(len(scores), dtype=bool)
+    decided = (scores >= high) | settled_safe
+    correct = ((scores >= high) & (labels == 1)) | (settled_safe & (labels == 0))
+    return {
+        "auc": _auc(scores, labels),
+        "decided": float(decided.mean()),
+        "decided_accuracy": float(correct[decided].mean()) if decided.any() else None,
+    }
+
+
+def save(base_path, embeddings, weights, bias, offset, ids):
+    os.makedirs(os.path.dirname(base_path) or ".", exist_ok=True)
+    np.save(f"{base_path}.embeddings.npy", embeddings.astype(np.float32))
+    np.save(f"{base_path}.weights.npy", weights.astype(np.float32))
+    np.save(f"{base_path}.bias.npy", np.append(bias, offset).astype(np.float32))
+    with open(f"{base_path}.ids.json", "w") as f:
+        json.dump(ids, f)
+
+
+_default_classifier = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+# Process-wide classifier, opened on first use; None if it has not been trained
+def get_default_classifier():
+    global _default_classifier, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            _default_loaded = True
+            try:
+                _default_classifier = PairClassifier()
+            except FileNotFoundError:
+                _default_classifier = None
+        return _default_classifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the drug pair classifier on known DrugBank interactions.")
+    parser.add_argument("--input", help="CSV with Drug1_ID, Drug2_ID, Y columns (default: download via TDC)")
+    parser.add_argument("--vocabulary", help="DrugBank vocabulary CSV, to resolve drug names to IDs")
+    parser.add_argument("--output", default=PAIR_CLASSIFIER_PATH, help="Base path of the model files")
+    parser.add_argument("--dim", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--learning-rate", type=float, default=0.05)
+    parser.add_argument("--holdout", type=float, default=0.05, help="Share of pairs kept back for evaluation")
+    parser.add_argument("--ids-only", action="store_true",
+                        help="Train without --vocabulary; the classifier then only matches DrugBank IDs, never names")
+    args = parser.parse_args()
+    # Without the vocabulary the lookup table holds DrugBank IDs only, and
+    # the names users type would silently never match
+    if not args.vocabulary and not args.ids_only:
+        parser.error("--vocabulary is required to match drug names (pass --ids-only to train on IDs alone)")
+
+    ids, pairs = {}, []
+    for drug1, drug2, _ in (load_csv_rows(args.input) if args.input else load_tdc_rows()):
+        pairs.append((ids.setdefault(normalize_drug(drug1), len(ids)), ids.setdefault(normalize_drug(drug2), len(ids))))
+    num_drugs = len(ids)
+    pairs = np.array(pairs, dtype=np.int64)
+    order = np.random.default_rng(0).permutation(len(pairs))
+    split = int(len(pairs) * (1 - args.holdout))
+    train_pairs, test_pairs = pairs[order[:split]], pairs[order[split:]]
+    print(f"{num_drugs} drugs, {len(train_pairs)} training pairs, {len(test_pairs)} held out")
+
+    embeddings, weights, bias, offset = train(train_pairs, num_drugs, args.dim, args.epochs, learning_rate=args.learning_rate)
+    if len(test_pairs):
+        print(f"Held-out: {evaluate(embeddings, weights, bias, offset, test_pairs, pairs, num_drugs)}")
+
+    if args.vocabulary:
+        for drugbank_id, names in load_vocabulary(args.vocabulary).items():
+            row = ids.get(normalize_drug(drugbank_id))
+            if row is not None:
+                for name in names:
+                    ids.setdefault(normalize_drug(name), row)
+    save(args.output, embeddings, weights, bias, offset, ids)
+    print(f"Wrote the classifier for {num_drugs} drugs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+import itertools
+import logging
+import math
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+NUM_WORKERS = int(os.environ.get("DDI_NUM_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+BATCH_WINDOW = float(os.environ.get("DDI_BATCH_WINDOW_MS", "5")) / 1000
+MAX_BATCH_SIZE = int(os.environ.get("DDI_MAX_BATCH_SIZE", "16"))
+# Tasks a scheduler holds (queued or running) before it turns new ones away;
+# batch traffic is turned away sooner so interactive requests still get in
+MAX_QUEUE = int(os.environ.get("DDI_MAX_QUEUE", "256"))
+MAX_BATCH_QUEUE = int(os.environ.get("DDI_MAX_BATCH_QUEUE", str(MAX_QUEUE // 2)))
+# Recently cancelled request IDs the workers can see
+CANCEL_SLOTS = 256
+
+# Priority lanes; lower runs first
+INTERACTIVE = 0
+BATCH = 1
+
+logger = logging.getLogger(__name__)
+
+
+# The scheduler is at capacity; try again in `retry_after` seconds
+class SchedulerBusy(RuntimeError):
+    def __init__(self, retry_after):
+        super().__init__(f"Scheduler is full; retry in {retry_after}s.")
+        self.retry_after = retry_after
+
+
+# The caller gave up on the task (cancel() or a client disconnect)
+class RequestCancelled(RuntimeError):
+    pass
+
+
+# The task's deadline passed before it finished
+class DeadlineExceeded(RequestCancelled):
+    pass
+
+
+_ERRORS = {"RequestCancelled": RequestCancelled, "DeadlineExceeded": DeadlineExceeded}
+
+
+# Worker process: owns one llama.cpp context and serves batches from the task
+# queue. Before each task, and after every generated token, it checks whether
+# the task was cancelled or ran past its deadline, and drops it if so. A task
+# that completed is returned even if its deadline passed meanwhile.
+def _worker_main(worker_id, model_path, model_kwargs, prefixes, warmup_prompt, task_queue, result_queue, cancelled):
+    try:
+        from llama_cpp import Llama
+        from inference import TASKS, PrefixCache
+
+        llm = Llama(model_path=model_path, **model_kwargs)
+        prefix_cache = PrefixCache()
+        for prefix in prefixes:
+            prefix_cache.register(prefix, pinned=True)
+        prefix_cache.warm(llm)
+        if warmup_prompt:
+            # Touch the weights and compute buffers so the first request is not the slow one
+            TASKS["generate"](llm, warmup_prompt, max_tokens=1, prefix_cache=prefix_cache)
+    except Exception as e:
+        result_queue.put(("failed", worker_id, f"{type(e).__name__}: {e}", None))
+        return
+    result_queue.put(("ready", worker_id, None, None))
+    while True:
+        batch = task_queue.get()
+        if batch is None:
+            break
+        for request_id, task, prompt, params, submitted_at, deadline in batch:
+            timings = {"queue_wait": time.time() - submitted_at}
+
+            stopped = []
+
+            def interrupted():
+                if deadline is not None and time.time() > deadline:
+                    return DeadlineExceeded("Deadline passed.")
+                if request_id in cancelled[:]:
+                    return RequestCancelled("Cancelled.")
+                return None
+
+            # Polled by generate after every token; remembers why it stopped
+            def should_stop():
+                if not stopped:
+                    error = interrupted()
+                    if error is not None:
+                        stopped.append(error)
+                return bool(stopped)
+
+            try:
+                error = interrupted()
+                if error is not None:
+                    raise error
+                if task == "generate":
+                    params = dict(params, should_stop=should_stop)
+                result = TASKS[task](llm, prompt, prefix_cache=prefix_cache, timings=timings, **params)
+                # A generation cut short is not an answer
+                if stopped:
+                    raise stopped[0]
+                result_queue.put((request_id, True, result, timings))
+            except Exception as e:
+                result_queue.put((request_id, False, f"{type(e).__name__}: {e}", timings))
+        result_queue.put(("batch_done", worker_id, None, None))
+
+
+class InferenceScheduler:
+    """
+    Queues generation requests and serves them from a pool of model worker
+    processes, each with its own llama.cpp context. Requests arriving within
+    `batch_window` seconds of each other are grouped into one micro-batch and
+    handed to whichever worker is free, so a single IPC round trip covers
+    the whole batch and no context is ever shared between threads.
+
+    `prefixes` are prompt prefixes every worker evaluates at startup and keeps
+    as saved states (see inference.PrefixCache); requests may register more
+    by passing `prefix=`.
+
+    Workers load the model in the background after `start()`; `status` goes
+    from "loading" to "ready" when the first one can take work (after running
+    `warmup_prompt`, if given), or to "failed" if none could load it.
+
+    `observer`, if given, is called as observer(task, ok, timings) from the
+    collector thread for every finished task, with the queue wait, prompt
+    evaluation and generation times and token counts the worker measured.
+
+    Admission and ordering: a task is refused with SchedulerBusy once
+    `max_queue` tasks are held (`max_batch_queue` for the BATCH lane).
+    Waiting tasks sit in a priority queue and a batch is only handed over
+    when a worker is free, so INTERACTIVE tasks overtake queued BATCH ones.
+    BATCH tasks are handed over one at a time, so a worker that frees up is
+    never committed to a run of them while an INTERACTIVE task waits.
+    A task may carry a wall-clock `deadline`; it is dropped with
+    DeadlineExceeded if that passes while it waits, and generation stops
+    if it passes mid-task. cancel() does the same on demand.
+    """
+
+    def __init__(self, model_path, num_workers=NUM_WORKERS, batch_window=BATCH_WINDOW,
+                 max_batch_size=MAX_BATCH_SIZE, model_kwargs=None, prefixes=(), observer=None,
+                 warmup_prompt=None, max_queue=MAX_QUEUE, max_batch_queue=MAX_BATCH_QUEUE):
+        self.model_path = model_path
+        self.warmup_prompt = warmup_prompt
+        self.observer = observer
+        self.prefixes = list(prefixes)
+        self.num_workers = max(1, num_workers)
+        self.batch_window = batch_window
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_queue = max_queue
+        self.max_batch_queue = max_batch_queue
+        self.model_kwargs = dict(model_kwargs or {})
+        # Split the cores between the replicas unless told otherwise
+        self.model_kwargs.setdefault("n_threads", max(1, (os.cpu_count() or 1) // self.num_workers))
+
+        self._requests = queue.PriorityQueue()
+        # One slot per worker; the dispatcher needs a free one to hand over a batch
+        self._slots = threading.Semaphore(self.num_workers)
+        # Moving average of seconds per task, for Retry-After
+        self._service_seconds = 1.0
+        self._rejected = 0
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._ready_workers = 0
+        self._failed_workers = 0
+        self.load_error = None
+        self._started_at = None
+        self.load_seconds = None
+        self._running = False
+        self._workers = []
+
+    def start(self):
+        self._started_at = time.monotonic()
+        if not os.path.exists(self.model_path):
+            self.load_error = f"Model file not found at {self.model_path}"
+            logger.error("Model file not found", extra={"model_path": self.model_path})
+            return
+        ctx = mp.get_context("spawn")
+        self._task_queue = ctx.Queue()
+        self._result_queue = ctx.Queue()
+        self._cancelled = ctx.Array("q", [-1] * CANCEL_SLOTS)
+        self._cancel_index = 0
+        for worker_id in range(self.num_workers):
+            process = ctx.Process(
+                target=_worker_main,
+                args=(worker_id, self.model_path, self.model_kwargs, self.prefixes, self.warmup_prompt,
+                      self._task_queue, self._result_queue, self._cancelled),
+                daemon=True,
+            )
+            process.start()
+            self._workers.append(process)
+
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._collector = threading.Thread(target=self._collect_loop, daemon=True)
+        self._dispatcher.start()
+        self._collector.start()
+
+    def stop(self, timeout=5):
+        if not self._workers:
+            return
+        self._running = False
+        self._requests.put((-1, -1, None))
+        self._slots.release()
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._result_queue.put(None)
+        self._collector.join(timeout)
+        with self._pending_lock:
+            for future, _ in self._pending.values():
+                future.set_exception(RuntimeError("Scheduler stopped."))
+            self._pending.clear()
+
+    @property
+    def ready(self):
+        return self._ready_workers > 0
+
+    @property
+    def status(self):
+        if self.ready:
+            return "ready"
+        if self.load_error is not None and self._failed_workers >= len(self._workers):
+            return "failed"
+        return "loading"
+
+    def queue_depth(self):
+        # Requests waiting to be batched plus those handed to a worker but not finished
+        with self._pending_lock:
+            return len(self._pending)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "waiting": self._requests.qsize(),
+            "rejected": self._rejected,
+            "workers": self.num_workers,
+            "ready_workers": self._ready_workers,
+            "failed_workers": self._failed_workers,
+            "status": self.status,
+            "load_seconds": self.load_seconds,
+            "load_error": self.load_error,
+        }
+
+    # Seconds until a refused caller is likely to get in: the held tasks spread over the workers
+    def retry_after(self):
+        return max(1, math.ceil(self.queue_depth() * self._service_seconds / self.num_workers))
+
+    # Queue a task ("generate" or "classify", see inference.TASKS) and return its
+    # future, which carries the task's `request_id` for cancel(). `priority` is
+    # INTERACTIVE or BATCH; `deadline` is a time.time() value or None.
+    def submit(self, prompt, task="generate", priority=INTERACTIVE, deadline=None, **params):
+        if not self._running:
+            raise RuntimeError("Scheduler is not running.")
+        limit = self.max_queue if priority == INTERACTIVE else self.max_batch_queue
+        future = Future()
+        request_id = next(self._ids)
+        future.request_id = request_id
+        with self._pending_lock:
+            admitted = not limit or len(self._pending) < limit
+            if admitted:
+                self._pending[request_id] = (future, task)
+            else:
+                self._rejected += 1
+        if not admitted:
+            raise SchedulerBusy(self.retry_after())
+        self._requests.put((priority, request_id, (request_id, task, prompt, params, time.time(), deadline)))
+        return future
+
+    # Give up on a task: it is dropped if still queued, and a worker running it
+    # stops at the next token. Returns False if it had already finished.
+    def cancel(self, request_id):
+        with self._pending_lock:
+            future, _ = self._pending.pop(request_id, (None, None))
+        if future is None:
+            return False
+        with self._cancelled.get_lock():
+            self._cancelled[self._cancel_index] = request_id
+            self._cancel_index = (self._cancel_index + 1) % CANCEL_SLOTS
+        future.set_exception(RequestCancelled("Cancelled."))
+        return True
+
+    def generate(self, prompt, timeout=None, **params):
+        return self.submit(prompt, task="generate", **params).result(timeout)
+
+    def classify(self, prompt, labels, timeout=None, **params):
+        return self.submit(prompt, task="classify", labels=labels, **params).result(timeout)
+
+    # Whether a queued task should still run; fails the futures of expired ones
+    def _live(self, item):
+        request_id, deadline = item[0], item[5]
+        with self._pending_lock:
+            if request_id not in self._pending:
+                # Cancelled while it waited
+                return False
+            if deadline is None or time.time() <= deadline:
+                return True
+            future, _ = self._pending.pop(request_id)
+        future.set_exception(DeadlineExceeded("Deadline passed while queued."))
+        return False
+
+    def _dispatch_loop(self):
+        while self._running:
+            # Wait for a free worker first, so waiting tasks stay in the
+            # priority queue (where they can be overtaken) until one can run
+            self._slots.acquire()
+            priority, _, item = self._requests.get()
+            if item is None:
+                break
+            batch = [item] if self._live(item) else []
+            # Keep collecting INTERACTIVE tasks until the window closes or the
+            # batch is full
+            deadline = time.monotonic() + self.batch_window
+            while priority == INTERACTIVE and len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry[2] is None:
+                    self._running = False
+                    break
+                if entry[0] != INTERACTIVE:
+                    # Back in line; it goes out on its own later
+                    self._requests.put(entry)
+                    break
+                if self._live(entry[2]):
+                    batch.append(entry[2])
+            if batch:
+                self._task_queue.put(batch)
+            else:
+                self._slots.release()
+
+    def _collect_loop(self):
+        while True:
+            message = self._result_queue.get()
+            if message is None:
+                break
+            request_id, ok, payload, timings = message
+            if request_id == "ready":
+                if self._ready_workers == 0:
+                    self.load_seconds = time.monotonic() - self._started_at
+                    logger.info("Model ready", extra={"model_path": self.model_path, "load_seconds": self.load_seconds})
+                self._ready_workers += 1
+                continue
+            if request_id == "batch_done":
+                self._slots.release()
+                continue
+            if request_id == "failed":
+                self._failed_workers += 1
+                self.load_error = payload
+                logger.error("Worker failed to load the model", extra={"worker": ok, "error": payload})
+                continue
+            with self._pending_lock:
+                future, task = self._pending.pop(request_id, (None, None))
+            if timings and ok:
+                seconds = timings.get("prompt_eval", 0.0) + timings.get("generation", 0.0)
+                self._service_seconds = 0.8 * self._service_seconds + 0.2 * seconds
+            if future is None:
+                continue
+            if self.observer is not None:
+                try:
+                    self.observer(task, ok, timings)
+                except Exception:
+                    logger.exception("Scheduler observer failed")
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(_ERRORS.get(payload.split(":", 1)[0], RuntimeError)(payload))
@@ -1,18 +1,119 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from llama_cpp import Llama
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from interaction_cache import normalize_drug
+from interaction_prompt import (
+    INTERACTION_PREFIX, VERDICT_LABELS, build_interaction_prompt, build_regimen_prompt, parse_regimen_verdicts, parse_verdict,
+    prompt_version, regimen_schema,
+)
+from logging_config import configure_logging
+from model_registry import ModelNotFound, ModelRegistry
+import model_config
+from scheduler import BATCH, INTERACTIVE, DeadlineExceeded, RequestCancelled, SchedulerBusy
+import metrics
+import asyncio
+import contextvars
+import hmac
+import json
+import logging
 import os
+import time
 
-app = FastAPI()
+configure_logging()
+logger = logging.getLogger(__name__)
 
-# Model path
-MODEL_PATH = "/Users/masudip/Library/Application Support/nomic.ai/GPT4All/Llama-3.2-1B-Instruct-Q4_0.gguf"
+# Token for the /admin endpoints; they are disabled when it is not set
+ADMIN_TOKEN = os.environ.get("DDI_ADMIN_TOKEN", "")
+# Output tokens budgeted per pair of a regimen-level answer
+REGIMEN_TOKENS_PER_PAIR = int(os.environ.get("DDI_REGIMEN_TOKENS_PER_PAIR", "40"))
+# The server process holds no tokenizer, so prompt lengths are estimated from
+# their size; llama.cpp vocabularies average about four bytes a token on
+# English text, so this errs on the long side
+BYTES_PER_TOKEN = 3
+# How often a waiting request checks whether its client has gone away
+DISCONNECT_POLL = float(os.environ.get("DDI_DISCONNECT_POLL_MS", "250")) / 1000
 
-# Load the model globally
-if not os.path.exists(MODEL_PATH):
-    raise FileNotFoundError(f"Model file not found at {MODEL_PATH}")
+# The models declared in model_config, each served by its own scheduler whose
+# worker processes load the weights (memory-mapped) in the background and keep
+# the evaluated state of the interaction-check preamble. The server answers
+# /healthz right away and /readyz once the default model has a ready worker.
+registry = ModelRegistry.from_config(prefixes=[INTERACTION_PREFIX], observer=metrics.record_inference)
+metrics.Gauge("ddi_scheduler_queue_depth", "Tasks submitted to the schedulers and not finished.",
+              function=lambda: sum(scheduler.queue_depth() for scheduler in registry.schedulers()))
+metrics.Gauge("ddi_ready_workers", "Scheduler workers with a model loaded.",
+              function=lambda: sum(scheduler.stats()["ready_workers"] for scheduler in registry.schedulers()))
 
-llm = Llama(model_path=MODEL_PATH)
+@asynccontextmanager
+async def lifespan(app):
+    registry.load_configured()
+    yield
+    registry.stop_all()
+
+# The HTTP request being served, so run_task can read its priority and
+# deadline headers and notice when its client disconnects
+_current_request = contextvars.ContextVar("current_request", default=None)
+
+async def capture_request(request: Request):
+    _current_request.set(request)
+
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(capture_request)])
+
+# Count and time every request under its route template, so unknown paths
+# cannot blow up the label set. Streaming responses are timed to their last
+# byte. A plain ASGI middleware rather than @app.middleware("http"): that
+# wraps requests in BaseHTTPMiddleware, which hides client disconnects from
+# Request.is_disconnected, so abandoned requests would keep their worker.
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics.in_flight_requests.inc()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.in_flight_requests.dec()
+            # The router records the matched route in the shared scope
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            metrics.requests_total.inc(path=path, status=status)
+            metrics.request_seconds.observe(time.perf_counter() - start, path=path)
+
+app.add_middleware(RequestMetricsMiddleware)
+
+# Liveness: the process is up and serving HTTP
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+# Readiness: a worker has the default model loaded and can take requests
+@app.get("/readyz")
+def readyz():
+    scheduler = registry.get()
+    if scheduler is None:
+        return JSONResponse({"status": "not loaded", "model": registry.default}, status_code=503)
+    stats = scheduler.stats()
+    body = {key: stats[key] for key in ("status", "ready_workers", "load_seconds", "load_error")}
+    body["model"] = registry.default
+    return JSONResponse(body, status_code=200 if scheduler.ready else 503)
+
+@app.get("/metrics")
+def read_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 class RequestBody(BaseModel):
     prompt: str
@@ -21,16 +122,375 @@ class RequestBody(BaseModel):
 def read_root():
     return {"message": "Llama model server is running!"}
 
+@app.get("/queue")
+def queue_status():
+    return registry.stats()
+
+@app.get("/models")
+def list_models():
+    return registry.stats()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled; set DDI_ADMIN_TOKEN.")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+class DefaultModelBody(BaseModel):
+    model: str
+    # Seconds to wait for the model to load before giving up on the swap
+    ready_timeout: float = 600
+    # Unload the previous default once its in-flight requests have drained
+    unload_previous: bool = False
+    drain_timeout: float = 60
+
+@app.post("/admin/models/{name}/load", dependencies=[Depends(require_admin)])
+def load_model(name: str):
+    try:
+        registry.load(name)
+    except ModelNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown model {name!r}.")
+    return registry.stats()["models"][name]
+
+@app.post("/admin/models/{name}/unload", dependencies=[Depends(require_admin)])
+async def unload_model(name: str, drain_timeout: float = 60):
+    try:
+        abandoned = await asyncio.to_thread(registry.unload, name, drain_timeout)
+    except ModelNotFound:
+        raise HTTPException(status_code=404, detail=f"Model {name!r} is not loaded.")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"model": name, "abandoned_requests": abandoned}
+
+# Load the model if needed, wait until it is ready, then make it the default.
+# Requests already running on the old default finish there.
+@app.post("/admin/models/default", dependencies=[Depends(require_admin)])
+async def set_default_model(body: DefaultModelBody):
+    try:
+        entry = registry.load(body.model)
+    except ModelNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown model {body.model!r}.")
+    deadline = time.monotonic() + body.ready_timeout
+    while not entry.scheduler.ready:
+        if entry.scheduler.status == "failed" or time.monotonic() > deadline:
+            raise HTTPException(status_code=503, detail=f"Model {body.model} is {entry.scheduler.status}.")
+        await asyncio.sleep(0.5)
+    previous = registry.set_default(body.model)
+    abandoned = None
+    if body.unload_previous and previous != body.model:
+        abandoned = await asyncio.to_thread(registry.unload, previous, body.drain_timeout)
+    return {"default": body.model, "previous": previous, "abandoned_requests": abandoned}
+
+# `prefix` optionally names a leading part of the prompt that the workers
+# should keep the evaluated state of, for prompts that share a long preamble
+# `model` picks one of the declared models; the default model otherwise
 class RequestBody(BaseModel):
     prompt: str
     max_tokens: int = 200
     temperature: float = 0.3
+    prefix: Optional[str] = None
+    model: Optional[str] = None
+
+class BatchRequestBody(BaseModel):
+    prompts: List[str]
+    max_tokens: int = 200
+    temperature: float = 0.3
+    prefix: Optional[str] = None
+    model: Optional[str] = None
+
+class ClassifyRequestBody(BaseModel):
+    prompt: str
+    labels: List[str] = list(VERDICT_LABELS)
+    prefix: Optional[str] = None
+    model: Optional[str] = None
+
+class MatrixRequestBody(BaseModel):
+    drugs: List[str]
+    # Accepted for parity with check_drug_interaction; the pair prompt does not use it yet
+    patient_info: Optional[List] = None
+    # "classify" scores the verdict labels directly; "generate" parses free text
+    mode: str = "classify"
+    max_tokens: int = 200
+    temperature: float = 0.3
+    model: Optional[str] = None
+
+class RegimenRequestBody(BaseModel):
+    drugs: List[str]
+    # A user profile row (see db.get_user_profile), described to the model
+    patient_info: Optional[List] = None
+    # Per prompt, capped to what the context leaves; defaults to DDI_REGIMEN_TOKENS_PER_PAIR per pair
+    max_tokens: Optional[int] = None
+    temperature: float = 0.1
+    model: Optional[str] = None
+
+# Scheduling hints from the request headers: X-Priority ("interactive", the
+# default, or "batch") picks the lane, and X-Request-Timeout (seconds) is how
+# long the client will wait, after which the work is dropped
+def request_scheduling(request):
+    if request is None:
+        return INTERACTIVE, None
+    priority = BATCH if request.headers.get("x-priority", "").lower() == "batch" else INTERACTIVE
+    try:
+        timeout = float(request.headers["x-request-timeout"])
+    except (KeyError, ValueError):
+        return priority, None
+    return priority, time.time() + timeout
 
+# Wait for a scheduler future, cancelling the task if the client disconnects
+# or this coroutine is cancelled (e.g. a stream whose client went away)
+async def wait_for_result(scheduler, future, request):
+    waiter = asyncio.wrap_future(future)
+    try:
+        while True:
+            done, _ = await asyncio.wait({waiter}, timeout=DISCONNECT_POLL)
+            if done:
+                return waiter.result()
+            if request is not None and await request.is_disconnected():
+                scheduler.cancel(future.request_id)
+                raise HTTPException(status_code=499, detail="Client disconnected.")
+    except asyncio.CancelledError:
+        scheduler.cancel(future.request_id)
+        raise
+
+# Queue a task on the model's scheduler and wait for its result, holding the
+# model so it is not unloaded underneath the request
+async def run_task(prompt, task, model=None, **params):
+    request = _current_request.get()
+    priority, deadline = request_scheduling(request)
+    try:
+        with registry.acquire(model) as scheduler:
+            if not scheduler.ready:
+                raise HTTPException(status_code=503, detail=f"Model {scheduler.status}.")
+            try:
+                future = scheduler.submit(prompt, task=task, priority=priority, deadline=deadline, **params)
+            except SchedulerBusy as e:
+                raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+            try:
+                return await wait_for_result(scheduler, future, request)
+            except DeadlineExceeded as e:
+                raise HTTPException(status_code=504, detail=str(e))
+            except RequestCancelled as e:
+                raise HTTPException(status_code=499, detail=str(e))
+            except RuntimeError as e:
+                raise HTTPException(status_code=500, detail=str(e))
+    except ModelNotFound:
+        raise HTTPException(status_code=404, detail=f"Model {model or registry.default!r} is not loaded.")
+
+# The model a request runs on; resolved once so every pair of a matrix uses the same one
+def resolve_model(model):
+    return model or registry.default
+
+async def run_model(prompt, max_tokens, temperature, prefix=None, model=None, json_schema=None):
+    params = {"json_schema": json_schema} if json_schema else {}
+    response = await run_task(
+        prompt, "generate", model=model, max_tokens=max_tokens, temperature=temperature, prefix=prefix, **params
+    )
+    logger.debug("Model output", extra={"response": response})
+    return response['choices'][0]['text'].strip()
+
+# Evaluate the prompt once and pick the most likely label, without decoding any text
+async def run_classifier(prompt, labels, prefix=None, model=None):
+    if not labels:
+        raise HTTPException(status_code=422, detail="At least one label is required.")
+    return await run_task(prompt, "classify", model=model, labels=list(labels), prefix=prefix)
+
+# Single-prompt answers carry the prompt version of the model that produced
+# them, so clients can tell answers from before and after a default swap apart
 @app.post("/generate/")
-def generate_text(request: RequestBody):
-    if not llm:
-        raise HTTPException(status_code=500, detail="Model not loaded.")
-    print(f"Received request: {request.prompt}")
-    response = llm(request.prompt, max_tokens=request.max_tokens, temperature=request.temperature)
-    print(response)
-    return {"response": response['choices'][0]['text'].strip()}
+async def generate_text(request: RequestBody):
+    logger.debug("Generate request", extra={"prompt": request.prompt})
+    model = resolve_model(request.model)
+    response = await run_model(request.prompt, request.max_tokens, request.temperature, request.prefix, model)
+    return {"response": response, "model": model, "prompt_version": prompt_version(model)}
+
+@app.post("/generate_batch/")
+async def generate_batch(request: BatchRequestBody):
+    logger.info("Batch request", extra={"prompts": len(request.prompts)})
+    # Submit everything at once so the scheduler can batch and spread it over the workers
+    model = resolve_model(request.model)
+    responses = await asyncio.gather(
+        *(run_model(prompt, request.max_tokens, request.temperature, request.prefix, model) for prompt in request.prompts)
+    )
+    return {"responses": list(responses)}
+
+@app.post("/classify/")
+async def classify_text(request: ClassifyRequestBody):
+    model = resolve_model(request.model)
+    result = await run_classifier(request.prompt, request.labels, request.prefix, model)
+    return dict(result, model=model, prompt_version=prompt_version(model))
+
+# Expand a drug list into its unique unordered pairs of distinct drugs.
+# Returns the canonical name of every input drug and the pairs to evaluate,
+# each pair given as (first input name, second input name) in input order.
+def expand_pairs(drugs):
+    canonical = [normalize_drug(drug) for drug in drugs]
+    first_name = {}
+    for drug, name in zip(drugs, canonical):
+        first_name.setdefault(name, drug)
+    names = list(first_name)
+    pairs = [(names[i], names[j]) for i in range(len(names)) for j in range(i + 1, len(names))]
+    return canonical, first_name, pairs
+
+@app.post("/interactions/matrix")
+async def interaction_matrix(request: MatrixRequestBody):
+    canonical, first_name, pairs = expand_pairs(request.drugs)
+    logger.info("Matrix request", extra={"drugs": len(request.drugs), "pairs": len(pairs)})
+
+    if request.mode not in ("classify", "generate"):
+        raise HTTPException(status_code=422, detail=f"Unknown mode {request.mode!r}.")
+
+    model = resolve_model(request.model)
+    prompts = [build_interaction_prompt(first_name[name1], first_name[name2]) for name1, name2 in pairs]
+    verdicts, probabilities = {}, {}
+    if request.mode == "classify":
+        results = await asyncio.gather(*(run_classifier(prompt, VERDICT_LABELS, model=model) for prompt in prompts))
+        for pair, result in zip(pairs, results):
+            verdicts[pair] = result["label"]
+            probabilities[pair] = result["probability"]
+    else:
+        outputs = await asyncio.gather(*(
+            run_model(prompt, request.max_tokens, request.temperature, model=model) for prompt in prompts
+        ))
+        for pair, output in zip(pairs, outputs):
+            verdicts[pair] = parse_verdict(output)
+    for (name1, name2) in pairs:
+        verdicts[(name2, name1)] = verdicts[(name1, name2)]
+
+    # Symmetric matrix over the drugs as given; duplicates and the diagonal are null
+    matrix = [
+        [verdicts.get((a, b)) for b in canonical]
+        for a in canonical
+    ]
+    return {
+        "drugs": request.drugs,
+        "model": model,
+        "prompt_version": prompt_version(model),
+        "matrix": matrix,
+        "pairs": [
+            {"drug1": first_name[a], "drug2": first_name[b], "verdict": verdicts[(a, b)],
+             "probability": probabilities.get((a, b))}
+            for a, b in pairs
+        ],
+    }
+
+# Verdict and probability for one pair of input drug names
+async def evaluate_pair(drug1, drug2, mode, max_tokens, temperature, model=None):
+    prompt = build_interaction_prompt(drug1, drug2)
+    if mode == "classify":
+        result = await run_classifier(prompt, VERDICT_LABELS, model=model)
+        return result["label"], result["probability"]
+    return parse_verdict(await run_model(prompt, max_tokens, temperature, model=model)), None
+
+# Same pairs as /interactions/matrix, streamed as newline-delimited JSON: one
+# {"drug1", "drug2", "verdict", "probability", "prompt_version"} line per pair as soon as it is
+# scored, so warnings reach the client without waiting for the slowest pair,
+# then a final {"done": true, "prompt_version": ...} line.
+@app.post("/interactions/stream")
+async def interaction_stream(request: MatrixRequestBody):
+    _, first_name, pairs = expand_pairs(request.drugs)
+    logger.info("Stream request", extra={"drugs": len(request.drugs), "pairs": len(pairs)})
+
+    if request.mode not in ("classify", "generate"):
+        raise HTTPException(status_code=422, detail=f"Unknown mode {request.mode!r}.")
+    model = resolve_model(request.model)
+    scheduler = registry.get(model)
+    if scheduler is None:
+        raise HTTPException(status_code=404, detail=f"Model {model!r} is not loaded.")
+    if not scheduler.ready:
+        raise HTTPException(status_code=503, detail=f"Model {scheduler.status}.")
+
+    version = prompt_version(model)
+
+    async def score(name1, name2):
+        drug1, drug2 = first_name[name1], first_name[name2]
+        try:
+            verdict, probability = await evaluate_pair(
+                drug1, drug2, request.mode, request.max_tokens, request.temperature, model
+            )
+        except HTTPException as e:
+            return {"drug1": drug1, "drug2": drug2, "verdict": "0", "probability": None, "error": e.detail}
+        return {"drug1": drug1, "drug2": drug2, "verdict": verdict, "probability": probability, "prompt_version": version}
+
+    async def lines():
+        # Everything is queued up front; lines go out in completion order
+        tasks = [asyncio.ensure_future(score(name1, name2)) for name1, name2 in pairs]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task) + "\n"
+            yield json.dumps({"done": True, "model": model, "prompt_version": version}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def estimate_tokens(text):
+    return len(text.encode("utf-8")) // BYTES_PER_TOKEN + 1
+
+def context_size(model):
+    return model_config.model_kwargs(registry.specs.get(model))["n_ctx"]
+
+# Split a regimen's pairs into chunks whose prompt and answer fit in `n_ctx`
+# tokens. Empty if not even one pair fits.
+def regimen_chunks(names, patient_info, pairs, n_ctx):
+    if not pairs:
+        return []
+    base = estimate_tokens(build_regimen_prompt(names, patient_info, pairs=[])) + 16
+    per_pair = REGIMEN_TOKENS_PER_PAIR + max(estimate_tokens(f"    - {a} + {b}\n") for a, b in pairs)
+    size = (n_ctx - base) // per_pair
+    if size < 1:
+        return []
+    return [pairs[i:i + size] for i in range(0, len(pairs), size)]
+
+# Grade one chunk of the regimen's pairs with the regimen prompt
+async def grade_regimen(names, chunk, patient_info, max_tokens, temperature, model, n_ctx):
+    prompt = build_regimen_prompt(names, patient_info, pairs=chunk)
+    budget = REGIMEN_TOKENS_PER_PAIR * len(chunk) + 16
+    max_tokens = min(max_tokens or budget, n_ctx - estimate_tokens(prompt))
+    output = await run_model(
+        prompt, max_tokens, temperature, model=model, json_schema=json.dumps(regimen_schema(names)),
+    )
+    return parse_regimen_verdicts(output, chunk)
+
+# The whole regimen in one prompt, with the patient profile, answered as a
+# schema-constrained JSON array of {drug1, drug2, verdict, severity}. A
+# regimen whose answer would not fit in the model's context is split into
+# several prompts, each still showing every drug. The answers are checked
+# against the requested pairs; any pair they miss or get wrong is scored on
+# its own with the pair classifier prompt instead. Each returned pair says
+# which path produced it ("regimen" or "pair").
+@app.post("/interactions/regimen")
+async def interaction_regimen(request: RegimenRequestBody):
+    _, first_name, pairs = expand_pairs(request.drugs)
+    logger.info("Regimen request", extra={"drugs": len(request.drugs), "pairs": len(pairs)})
+    model = resolve_model(request.model)
+
+    names = list(first_name.values())
+    pairs = [(first_name[a], first_name[b]) for a, b in pairs]
+    n_ctx = context_size(model)
+    chunks = regimen_chunks(names, request.patient_info, pairs, n_ctx)
+    if len(chunks) > 1:
+        logger.info("Regimen split to fit the context", extra={"pairs": len(pairs), "prompts": len(chunks)})
+    graded = {}
+    for verdicts in await asyncio.gather(*(
+        grade_regimen(names, chunk, request.patient_info, request.max_tokens, request.temperature, model, n_ctx)
+        for chunk in chunks
+    )):
+        graded.update(verdicts)
+
+    missing = [pair for pair in pairs if pair not in graded]
+    if missing:
+        logger.info("Regimen answer incomplete", extra={"pairs": len(pairs), "fallback_pairs": len(missing)})
+    fallback = await asyncio.gather(*(
+        evaluate_pair(drug1, drug2, "classify", request.max_tokens, request.temperature, model) for drug1, drug2 in missing
+    ))
+
+    results = [
+        {"drug1": drug1, "drug2": drug2, "verdict": verdict, "severity": severity, "source": "regimen"}
+        for (drug1, drug2), (verdict, severity) in graded.items()
+    ]
+    results += [
+        {"drug1": drug1, "drug2": drug2, "verdict": verdict, "severity": None, "source": "pair"}
+        for (drug1, drug2), (verdict, _) in zip(missing, fallback)
+    ]
+    return {"drugs": request.drugs, "model": model, "prompt_version": prompt_version(model), "pairs": results}
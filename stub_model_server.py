@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from typing import List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from interaction_prompt import PROMPT_VERSION, SEVERITY_LABELS, VERDICT_LABELS, build_interaction_prompt
+
+# Stand-in for server.py with no model behind it, for batch jobs and
+# benchmarks. Every call waits LATENCY +/- JITTER seconds, then answers with a
+# verdict derived from a hash of the prompt, so repeated runs agree.
+LATENCY = float(os.environ.get("DDI_STUB_LATENCY", "0.05"))
+JITTER = float(os.environ.get("DDI_STUB_JITTER", "0.0"))
+# Share of prompts answered "-1"
+INTERACTION_RATE = float(os.environ.get("DDI_STUB_INTERACTION_RATE", "0.2"))
+
+app = FastAPI()
+
+
+class RequestBody(BaseModel):
+    prompt: str
+    max_tokens: int = 200
+    temperature: float = 0.3
+    prefix: Optional[str] = None
+
+
+class ClassifyRequestBody(BaseModel):
+    prompt: str
+    labels: List[str] = list(VERDICT_LABELS)
+    prefix: Optional[str] = None
+
+
+class MatrixRequestBody(BaseModel):
+    drugs: List[str]
+    patient_info: Optional[List] = None
+    mode: str = "classify"
+    max_tokens: int = 200
+    temperature: float = 0.3
+
+
+class RegimenRequestBody(BaseModel):
+    drugs: List[str]
+    patient_info: Optional[List] = None
+    max_tokens: Optional[int] = None
+    temperature: float = 0.1
+
+
+def stub_verdict(prompt):
+    digest = hashlib.sha1(prompt.encode()).digest()
+    return "-1" if int.from_bytes(digest[:4], "big") / 2 ** 32 < INTERACTION_RATE else "+1"
+
+
+async def wait():
+    await asyncio.sleep(max(0.0, LATENCY + random.uniform(-JITTER, JITTER)))
+
+
+def pairs_of(drugs):
+    names = list(dict.fromkeys(drugs))
+    return [(names[i], names[j]) for i in range(len(names)) for j in range(i + 1, len(names))]
+
+
+@app.get("/")
+def read_root():
+    return {"message": "Stub model server is running!"}
+
+
+@app.post("/generate/")
+async def generate_text(request: RequestBody):
+    await wait()
+    return {"response": f"Verdict: {stub_verdict(request.prompt)}", "prompt_version": PROMPT_VERSION}
+
+
+@app.post("/classify/")
+async def classify_text(request: ClassifyRequestBody):
+    await wait()
+    label = stub_verdict(request.prompt)
+    if label not in request.labels:
+        label = request.labels[0]
+    return {
+        "label": label, "probability": 0.9, "scores": {name: 0.0 for name in request.labels},
+        "prompt_version": PROMPT_VERSION,
+    }
+
+
+@app.post("/interactions/matrix")
+async def interaction_matrix(request: MatrixRequestBody):
+    await wait()
+    verdicts = {}
+    for drug1, drug2 in pairs_of(request.drugs):
+        verdicts[(drug1, drug2)] = verdicts[(drug2, drug1)] = stub_verdict(build_interaction_prompt(drug1, drug2))
+    return {
+        "drugs": request.drugs,
+        "prompt_version": PROMPT_VERSION,
+        "matrix": [[verdicts.get((a, b)) for b in request.drugs] for a in request.drugs],
+        "pairs": [
+            {"drug1": a, "drug2": b, "verdict": verdicts[(a, b)], "probability": 0.9}
+            for a, b in pairs_of(request.drugs)
+        ],
+    }
+
+
+@app.post("/interactions/stream")
+async def interaction_stream(request: MatrixRequestBody):
+    async def lines():
+        for drug1, drug2 in pairs_of(request.drugs):
+            await wait()
+            verdict = stub_verdict(build_interaction_prompt(drug1, drug2))
+            yield json.dumps({
+                "drug1": drug1, "drug2": drug2, "verdict": verdict, "probability": 0.9, "prompt_version": PROMPT_VERSION,
+            }) + "\n"
+        yield json.dumps({"done": True, "prompt_version": PROMPT_VERSION}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/interactions/regimen")
+async def interaction_regimen(request: RegimenRequestBody):
+    await wait()
+    results = []
+    for drug1, drug2 in pairs_of(request.drugs):
+        prompt = build_interaction_prompt(drug1, drug2)
+        verdict = stub_verdict(prompt)
+        severity = SEVERITY_LABELS[hashlib.sha1(prompt.encode()).digest()[4] % 3] if verdict == "-1" else "none"
+        results.append({"drug1": drug1, "drug2": drug2, "verdict": verdict, "severity": severity, "source": "regimen"})
+    return {"drugs": request.drugs, "prompt_version": PROMPT_VERSION, "pairs": results}
+
+
+def main():
+    global LATENCY, JITTER, INTERACTION_RATE
+    parser = argparse.ArgumentParser(description="Serve canned interaction verdicts with a configurable delay.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=LATENCY, help="Seconds each call takes")
+    parser.add_argument("--jitter", type=float, default=JITTER, help="Uniform +/- seconds added to the latency")
+    parser.add_argument("--interaction-rate", type=float, default=INTERACTION_RATE, help="Share of pairs answered -1")
+    args = parser.parse_args()
+    LATENCY, JITTER, INTERACTION_RATE = args.latency, args.jitter, args.interaction_rate
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
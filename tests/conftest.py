@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_LLAMA = os.path.join(ROOT, "tests", "fake_llama")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, FAKE_LLAMA)
+# Spawned scheduler workers and server subprocesses import the fake too
+os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [FAKE_LLAMA, ROOT, os.environ.get("PYTHONPATH")]))
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"")
+    return str(path)
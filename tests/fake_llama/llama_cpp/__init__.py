@@ -0,0 +1,62 @@
+"""
+Minimal stand-in for llama_cpp, for the scheduler and server tests: it
+"generates" one token every FAKE_TOKEN_SECONDS and echoes the prompt back,
+and scores classification labels from fixed logits.
+"""
+import os
+import time
+
+import numpy as np
+
+FAKE_TOKEN_SECONDS = float(os.environ.get("DDI_FAKE_TOKEN_SECONDS", "0.01"))
+
+
+class StoppingCriteriaList(list):
+    def __call__(self, tokens, logits):
+        return any(criterion(tokens, logits) for criterion in self)
+
+
+class LlamaGrammar:
+    @classmethod
+    def from_json_schema(cls, schema, verbose=False):
+        return cls()
+
+
+class Llama:
+    def __init__(self, model_path, **kwargs):
+        self.input_ids = []
+
+    @property
+    def n_tokens(self):
+        return len(self.input_ids)
+
+    @n_tokens.setter
+    def n_tokens(self, n):
+        self.input_ids = self.input_ids[:n]
+
+    @property
+    def scores(self):
+        return np.zeros((max(1, self.n_tokens), 256), dtype=np.float32)
+
+    def tokenize(self, text, add_bos=True):
+        return list(text)
+
+    def eval(self, tokens):
+        self.input_ids = self.input_ids + list(tokens)
+
+    def reset(self):
+        self.input_ids = []
+
+    def save_state(self):
+        return list(self.input_ids)
+
+    def load_state(self, state):
+        self.input_ids = list(state)
+
+    def __call__(self, prompt, max_tokens=16, stopping_criteria=None, **kwargs):
+        generated = 0
+        for generated in range(1, max_tokens + 1):
+            time.sleep(FAKE_TOKEN_SECONDS)
+            if stopping_criteria is not None and stopping_criteria([], None):
+                break
+        return {"choices": [{"text": prompt}], "usage": {"completion_tokens": generated}}
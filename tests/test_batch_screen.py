@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import sys
+
+import pytest
+
+import batch_screen
+import db
+import interaction_checker
+from interaction_prompt import PROMPT_VERSION
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / "users.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    monkeypatch.setenv("DDI_DB_PATH", path)
+    monkeypatch.setenv("DDI_REQUEST_PRIORITY", "interactive")
+    db.init_db()
+    for username, drugs in {"ann": ["warfarin", "aspirin", "ibuprofen"], "bob": ["warfarin", "aspirin"]}.items():
+        db.add_user(username, "hash", 170, 70, "", "oral", "F", "")
+        for drug in drugs:
+            db.add_drugs(username, drug, "1 tablet")
+    return path
+
+
+@pytest.fixture
+def screened(monkeypatch):
+    calls = []
+
+    def screen_pairs(pairs, verdicts, checkpoint_path, workers):
+        calls.append(sorted(batch_screen.pair_key(*pair) for pair in pairs))
+        for pair in pairs:
+            verdicts[batch_screen.pair_key(*pair)] = "+1"
+        return 1.0
+
+    monkeypatch.setattr(batch_screen, "screen_pairs", screen_pairs)
+    return calls
+
+
+def run(monkeypatch, database, checkpoint, *args):
+    argv = ["batch_screen.py", "--db", database, "--checkpoint", str(checkpoint), "--workers", "1", *args]
+    monkeypatch.setattr(sys, "argv", argv)
+    batch_screen.main()
+
+
+def write_checkpoint(path, *entries):
+    with open(path, "w") as f:
+        for drug1, drug2, verdict, version in entries:
+            f.write(json.dumps({"drug1": drug1, "drug2": drug2, "verdict": verdict, "model_version": version}) + "\n")
+        # A line cut short by a crash
+        f.write('{"drug1": "warf')
+
+
+def unique_pairs():
+    unique, _, _ = batch_screen.collect_pairs()
+    return sorted(unique)
+
+
+def stored_interactions(database):
+    with sqlite3.connect(database) as conn:
+        return sorted(conn.execute("SELECT username, drug1, drug2, verdict, model_version FROM interactions"))
+
+
+def test_resume_evaluates_only_pairs_missing_from_the_checkpoint(database, screened, tmp_path, monkeypatch):
+    pairs = unique_pairs()
+    assert len(pairs) == 3
+    checkpoint = tmp_path / "screening.jsonl"
+    done, stale = pairs[0], pairs[1]
+    write_checkpoint(checkpoint, (*done, "-1", PROMPT_VERSION), (*stale, "-1", "another-model"))
+
+    run(monkeypatch, database, checkpoint)
+
+    assert screened == [sorted(pairs[1:])]
+    rows = stored_interactions(database)
+    assert len(rows) == 4
+    assert all(version == PROMPT_VERSION for *_, version in rows)
+    assert {verdict for _, drug1, drug2, verdict, _ in rows if (drug1, drug2) == done} == {"-1"}
+
+
+def test_fresh_ignores_the_checkpoint(database, screened, tmp_path, monkeypatch):
+    pairs = unique_pairs()
+    checkpoint = tmp_path / "screening.jsonl"
+    write_checkpoint(checkpoint, *((*pair, "-1", PROMPT_VERSION) for pair in pairs))
+
+    run(monkeypatch, database, checkpoint, "--fresh")
+
+    assert screened == [pairs]
+    assert {verdict for *_, verdict, _ in stored_interactions(database)} == {"+1"}
+
+
+def test_complete_checkpoint_needs_no_model_calls(database, screened, tmp_path, monkeypatch):
+    checkpoint = tmp_path / "screening.jsonl"
+    write_checkpoint(checkpoint, *((*pair, "-1", PROMPT_VERSION) for pair in unique_pairs()))
+
+    run(monkeypatch, database, checkpoint)
+
+    assert screened == []
+    assert len(stored_interactions(database)) == 4
+
+
+def test_locked_cache_fails_only_that_pair(monkeypatch):
+    def check_drug_interaction(drug1, dosage1, drug2, dosage2, patient_info, timeout=None):
+        if drug1 == "locked":
+            raise sqlite3.OperationalError("database is locked")
+        return "-1", True
+
+    monkeypatch.setattr(interaction_checker, "check_drug_interaction", check_drug_interaction)
+    assert batch_screen._screen_pair(("locked", "aspirin")) == ("locked", "aspirin", "0")
+    assert batch_screen._screen_pair(("warfarin", "aspirin")) == ("warfarin", "aspirin", "-1")
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / "users.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    return path
+
+
+def columns(path, table):
+    with sqlite3.connect(path) as conn:
+        return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def user_version(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Apply the first `count` migrations, as an older release would have
+def migrate_to(path, count):
+    with sqlite3.connect(path) as conn:
+        for number, statements in enumerate(db.MIGRATIONS[:count], start=1):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+
+def test_new_database_gets_the_current_schema(database):
+    db.init_db()
+    assert user_version(database) == len(db.MIGRATIONS)
+    assert "drug_id" in columns(database, "drugs")
+    assert "severity" in columns(database, "interactions")
+
+
+def test_original_schema_is_upgraded_in_place(database):
+    # users.db as the apps created it before migrations were tracked
+    with sqlite3.connect(database) as conn:
+        conn.execute(
+            """CREATE TABLE users
+                     (username TEXT PRIMARY KEY, password TEXT, height FLOAT, weight FLOAT,
+                      comorbidities TEXT, route TEXT, gender TEXT, substance_use TEXT)"""
+        )
+        conn.execute("CREATE TABLE drugs (username TEXT, drug_name TEXT, dosage TEXT)")
+        conn.execute("INSERT INTO users VALUES ('ann', 'hash', 170, 70, '', 'oral', 'F', '')")
+        conn.execute("INSERT INTO drugs VALUES ('ann', 'warfarin', '5 mg')")
+
+    db.init_db()
+
+    assert user_version(database) == len(db.MIGRATIONS)
+    assert db.get_user_drugs("ann") == [("warfarin", "5 mg")]
+    assert db.get_password_hash("ann") == "hash"
+    db.save_user_interactions("ann", [("aspirin", "warfarin", "-1", "high")], "v1")
+    assert db.get_user_interactions("ann", "v1") == {("aspirin", "warfarin"): ("-1", "high")}
+
+
+def test_only_missing_migrations_run(database):
+    migrate_to(database, len(db.MIGRATIONS) - 1)
+    with sqlite3.connect(database) as conn:
+        conn.execute("INSERT INTO interactions (username, drug1, drug2, verdict, model_version) "
+                     "VALUES ('ann', 'aspirin', 'warfarin', '-1', 'v1')")
+
+    db.init_db()
+
+    assert user_version(database) == len(db.MIGRATIONS)
+    assert db.get_user_interactions("ann", "v1") == {("aspirin", "warfarin"): ("-1", None)}
+
+
+def test_init_db_is_idempotent(database, monkeypatch):
+    db.init_db()
+    # As a new process would: nothing remembered, schema already current
+    monkeypatch.setattr(db, "_migrated", set())
+    db.init_db()
+    assert user_version(database) == len(db.MIGRATIONS)
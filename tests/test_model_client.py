@@ -0,0 +1,126 @@
+import pytest
+import requests
+
+import model_client
+from model_client import CircuitBreaker, CircuitOpenError, ModelClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_client.time, "monotonic", clock)
+    monkeypatch.setattr(model_client.time, "sleep", lambda seconds: None)
+    return clock
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_breaker_success_resets_the_count(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(threshold=5, cooldown=10)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Session:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def client(session, threshold=5):
+    instance = ModelClient("http://model", max_retries=3, breaker=CircuitBreaker(threshold=threshold, cooldown=10))
+    instance.session = session
+    return instance
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.InvalidURL("bad"), ValueError("boom")])
+def test_trial_that_raises_does_not_wedge_the_breaker(clock, error):
+    instance = client(Session(requests.ConnectionError(), error, Response(200)), threshold=1)
+    with pytest.raises(CircuitOpenError):
+        instance.post("/generate/", {})
+    clock.now += 10
+    with pytest.raises(type(error)):
+        instance.post("/generate/", {})
+    assert instance.breaker.state == "open"
+    clock.now += 10
+    assert instance.post("/generate/", {}).status_code == 200
+    assert instance.breaker.state == "closed"
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_busy_server_is_retried_without_tripping_the_breaker(clock, status):
+    busy = [Response(status, {"Retry-After": "1"}) for _ in range(2)]
+    instance = client(Session(*busy, Response(200)), threshold=1)
+    assert instance.post("/generate/", {}).status_code == 200
+    assert all(response.closed for response in busy)
+    assert instance.breaker.state == "closed"
+
+
+def test_gateway_timeout_is_not_retried(clock):
+    session = Session(Response(504), Response(200))
+    assert client(session).post("/generate/", {}).status_code == 504
+    assert session.calls == 1
+
+
+def test_server_errors_are_retried(clock):
+    session = Session(Response(500), Response(502), Response(200))
+    assert client(session).post("/generate/", {}).status_code == 200
+    assert session.calls == 3
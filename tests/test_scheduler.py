@@ -0,0 +1,159 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import scheduler
+from conftest import ROOT
+
+
+def wait_ready(instance, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not instance.ready:
+        assert time.monotonic() < deadline, "worker did not load"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def one_worker(model_file):
+    instance = scheduler.InferenceScheduler(model_file, num_workers=1, max_queue=4, max_batch_queue=3)
+    instance.start()
+    wait_ready(instance)
+    yield instance
+    instance.stop()
+
+
+def text(future, timeout=10):
+    return future.result(timeout)["choices"][0]["text"]
+
+
+def test_admission_limits_per_lane(one_worker):
+    running = one_worker.submit("running", max_tokens=200)
+    batch = [one_worker.submit(f"b{i}", priority=scheduler.BATCH, max_tokens=1) for i in range(2)]
+    with pytest.raises(scheduler.SchedulerBusy) as busy:
+        one_worker.submit("b2", priority=scheduler.BATCH, max_tokens=1)
+    assert busy.value.retry_after >= 1
+    interactive = one_worker.submit("i0", max_tokens=1)
+    with pytest.raises(scheduler.SchedulerBusy):
+        one_worker.submit("i1", max_tokens=1)
+    assert one_worker.stats()["rejected"] == 2
+
+    one_worker.cancel(running.request_id)
+    assert [text(f) for f in batch + [interactive]] == ["b0", "b1", "i0"]
+
+
+def test_interactive_overtakes_queued_batch_work(one_worker):
+    running = one_worker.submit("running", max_tokens=30)
+    time.sleep(0.05)
+    finished = []
+    futures = [one_worker.submit("b0", priority=scheduler.BATCH, max_tokens=5),
+               one_worker.submit("b1", priority=scheduler.BATCH, max_tokens=5),
+               one_worker.submit("i0", max_tokens=5)]
+    for future in futures:
+        future.add_done_callback(lambda f: finished.append(f.result()["choices"][0]["text"]))
+    text(running)
+    for future in futures:
+        future.result(10)
+    assert finished == ["i0", "b0", "b1"]
+
+
+def test_deadline_passed_while_queued(one_worker):
+    future = one_worker.submit("late", deadline=time.time() - 1, max_tokens=1)
+    with pytest.raises(scheduler.DeadlineExceeded):
+        future.result(10)
+
+
+def test_deadline_stops_generation(one_worker):
+    start = time.monotonic()
+    future = one_worker.submit("slow", deadline=time.time() + 0.2, max_tokens=1000)
+    with pytest.raises(scheduler.DeadlineExceeded):
+        future.result(10)
+    assert time.monotonic() - start < 2
+    assert text(one_worker.submit("next", max_tokens=1)) == "next"
+
+
+def test_cancel_frees_the_worker(one_worker):
+    future = one_worker.submit("slow", max_tokens=1000)
+    time.sleep(0.1)
+    assert one_worker.cancel(future.request_id)
+    with pytest.raises(scheduler.RequestCancelled):
+        future.result(1)
+    start = time.monotonic()
+    assert text(one_worker.submit("next", max_tokens=1)) == "next"
+    assert time.monotonic() - start < 2
+    assert not one_worker.cancel(future.request_id)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server_url(model_file, tmp_path):
+    port = free_port()
+    env = dict(os.environ, DDI_MODEL_PATH=model_file, DDI_NUM_WORKERS="1", DDI_MAX_QUEUE="2", DDI_DB_PATH=str(tmp_path / "users.db"))
+    env.pop("DDI_MODELS_CONFIG", None)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            assert time.monotonic() < deadline, "server did not become ready"
+            try:
+                if requests.get(f"{url}/readyz", timeout=1).status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def queue_depth(url):
+    return sum(model.get("queue_depth", 0) for model in requests.get(f"{url}/queue", timeout=5).json()["models"].values())
+
+
+def test_client_disconnect_cancels_the_generation(server_url):
+    with pytest.raises(requests.Timeout):
+        requests.post(f"{server_url}/generate/", json={"prompt": "slow", "max_tokens": 1000}, timeout=0.5)
+
+    deadline = time.monotonic() + 3
+    while queue_depth(server_url):
+        assert time.monotonic() < deadline, "abandoned request still holds the worker"
+        time.sleep(0.05)
+    start = time.monotonic()
+    response = requests.post(f"{server_url}/generate/", json={"prompt": "next", "max_tokens": 1}, timeout=10)
+    assert response.status_code == 200
+    assert time.monotonic() - start < 2
+
+
+def test_request_timeout_header_sets_the_deadline(server_url):
+    response = requests.post(f"{server_url}/generate/", json={"prompt": "slow", "max_tokens": 1000},
+                             headers={"X-Request-Timeout": "0.2"}, timeout=10)
+    assert response.status_code == 504
+
+
+def test_full_queue_answers_429_with_retry_after(server_url):
+    with ThreadPoolExecutor(2) as pool:
+        held = [pool.submit(requests.post, f"{server_url}/generate/", json={"prompt": "hold", "max_tokens": 100},
+                            timeout=10) for _ in range(2)]
+        deadline = time.monotonic() + 3
+        while queue_depth(server_url) < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        response = requests.post(f"{server_url}/generate/", json={"prompt": "x", "max_tokens": 1}, timeout=10)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert [future.result().status_code for future in held] == [200, 200]
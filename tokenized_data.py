@@ -0,0 +1,80 @@
+import hashlib
+import os
+
+import numpy as np
+
+from training_data import TRAINING_DATA_DIR
+
+# Tokenized datasets, one directory per tokenizer + source data + settings
+TOKENIZED_DIR = os.environ.get("DDI_TOKENIZED_DIR", os.path.join(TRAINING_DATA_DIR, "tokenized"))
+TOKENIZE_WORKERS = int(os.environ.get("DDI_TOKENIZE_WORKERS", str(os.cpu_count() or 1)))
+# Bump when the tokenized columns change, so stale caches are not reused
+TOKENIZE_VERSION = "1"
+
+
+def _data_stamp(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+# Cache key for tokenizing `column` of the Arrow file at `path`. The tokenizer
+# is hashed by content (vocabulary, special tokens, settings), so two copies
+# of the same tokenizer share a cache and any change to it starts a new one.
+def cache_key(tokenizer, path, column, max_length):
+    from datasets.fingerprint import Hasher
+
+    parts = [TOKENIZE_VERSION, Hasher.hash(tokenizer), _data_stamp(path), column, str(max_length)]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:16]
+
+
+# Tokenize one text column of an Arrow cache written by training_data,
+# without padding (batches are padded when they are built, see collator).
+# Adds a "length" column for length-grouped batching. The result is saved
+# once and memory-mapped from disk on every later call with the same
+# tokenizer and data, skipping tokenization entirely.
+def tokenize_dataset(path, tokenizer, column, max_length=None, num_proc=TOKENIZE_WORKERS, cache_dir=None):
+    from datasets import Dataset, load_from_disk
+
+    cache_path = os.path.join(cache_dir or TOKENIZED_DIR, cache_key(tokenizer, path, column, max_length))
+    if os.path.exists(cache_path):
+        return load_from_disk(cache_path)
+
+    def tokenize(batch):
+        encoded = tokenizer(batch[column], truncation=True, max_length=max_length)
+        encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+        return encoded
+
+    dataset = Dataset.from_file(path)
+    tokenized = dataset.map(
+        tokenize, batched=True, num_proc=num_proc if num_proc > 1 else None, remove_columns=dataset.column_names,
+        desc="Tokenizing",
+    )
+    tokenized.save_to_disk(cache_path + ".part")
+    os.replace(cache_path + ".part", cache_path)
+    return load_from_disk(cache_path)
+
+
+# Pads each batch only to its own longest sequence (rounded up to a multiple
+# of 8 for tensor cores) and sets the causal LM labels
+def collator(tokenizer):
+    from transformers import DataCollatorForLanguageModeling
+
+    return DataCollatorForLanguageModeling(tokenizer, mlm=False, pad_to_multiple_of=8)
+
+
+# Batches of indices in which lengths are close, so dynamic padding adds
+# little: shuffle, cut into mega-batches of `batch_size * bucket_batches`
+# rows, sort each by length, slice into batches and shuffle the batch order.
+# This is what Trainer does with group_by_length=True; this is for custom loops.
+def length_bucketed_batches(lengths, batch_size, bucket_batches=50, seed=None):
+    lengths = np.asarray(lengths)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(lengths))
+    batches = []
+    bucket = batch_size * bucket_batches
+    for start in range(0, len(order), bucket):
+        chunk = order[start:start + bucket]
+        chunk = chunk[np.argsort(-lengths[chunk], kind="stable")]
+        batches.extend(chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size))
+    rng.shuffle(batches)
+    return batches
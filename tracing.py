@@ -0,0 +1,127 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Append every finished trace to this JSONL file; unset, traces are only logged at DEBUG
+TRACE_PATH = os.environ.get("DDI_TRACE_PATH")
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("ddi_trace", default=None)
+_export_lock = threading.Lock()
+
+
+class Trace:
+    """
+    Timing spans recorded while one check runs. Spans are added from any
+    thread that has the trace bound (see `bind`), so a check that fans out
+    to a thread pool still ends up with a single trace.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, duration, attrs):
+        span = {
+            "name": name,
+            "start_ms": (start - self._start) * 1000,
+            "duration_ms": duration * 1000,
+            "thread": threading.current_thread().name,
+        }
+        span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    # Total time and call count per span name
+    def summary(self):
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = totals.setdefault(span["name"], {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += span["duration_ms"]
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration * 1000 if self.duration is not None else None,
+            "spans": spans,
+        }
+
+
+# Record spans for everything run inside the block, then export the trace
+@contextmanager
+def trace(name):
+    current = Trace(name)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+        current.finish()
+        export(current)
+
+
+# Time the block as a span of the current trace; a no-op outside one.
+# Yields a dict the block can add attributes to.
+@contextmanager
+def span(name, **attrs):
+    current = _current.get()
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        if current is not None:
+            current.add(name, start, time.perf_counter() - start, attrs)
+
+
+def traced(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Wrap `function` so it records into the caller's trace when run on another thread
+def bind(function):
+    current = _current.get()
+    if current is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current.set(current)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+def export(finished):
+    data = finished.to_dict()
+    logger.debug("Trace finished", extra={"trace": data})
+    if TRACE_PATH:
+        with _export_lock, open(TRACE_PATH, "a") as f:
+            f.write(json.dumps(data) + "\n")
@@ -0,0 +1,186 @@
+import argparse
+import os
+import zipfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+# Where the ingested training tables are cached, as Arrow IPC streams: the
+# format datasets.Dataset.from_file memory-maps
+TRAINING_DATA_DIR = os.environ.get("DDI_TRAINING_DATA_DIR", os.path.join("data", "training"))
+BIOGRID_URL = os.environ.get(
+    "DDI_BIOGRID_URL",
+    "https://downloads.thebiogrid.org/Download/BioGRID/Release-Archive/BIOGRID-4.4.220/BIOGRID-ALL-4.4.220.tab3.zip",
+)
+# Bytes of CSV parsed per chunk
+READ_BLOCK_SIZE = int(os.environ.get("DDI_READ_BLOCK_SIZE", str(16 << 20)))
+# Bump when the cached tables change shape, so stale caches get rebuilt
+INGEST_VERSION = "1"
+
+BIOGRID_COLUMNS = {
+    "Official Symbol Interactor A": pa.string(),
+    "Official Symbol Interactor B": pa.string(),
+    "Organism Name Interactor A": pa.string(),
+    "Organism Name Interactor B": pa.string(),
+    "Experimental System": pa.string(),
+    "Score": pa.float64(),
+}
+DDI_COLUMNS = {"Drug1_ID": pa.string(), "Drug1": pa.string(), "Drug2_ID": pa.string(), "Drug2": pa.string(), "Y": pa.int64()}
+
+
+def download(url, path):
+    if not os.path.exists(path):
+        import urllib.request
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        urllib.request.urlretrieve(url, path + ".part")
+        os.replace(path + ".part", path)
+    return path
+
+
+# Identifies the source a cache was built from; a changed file means a rebuild
+def _source_stamp(path):
+    stat = os.stat(path)
+    return f"{INGEST_VERSION}:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _is_fresh(cache_path, stamp):
+    if not os.path.exists(cache_path):
+        return False
+    with pa.memory_map(cache_path) as source:
+        metadata = pa.ipc.open_stream(source).schema.metadata or {}
+    return metadata.get(b"source") == stamp.encode()
+
+
+# Stream record batches into an Arrow IPC stream file, written under a temporary name
+# and renamed into place so readers never see a half-written cache
+def _write_batches(batches, schema, cache_path, stamp):
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    schema = schema.with_metadata({"source": stamp})
+    rows = 0
+    with pa.OSFile(cache_path + ".part", "wb") as sink, pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_table(batch.cast(schema))
+            rows += batch.num_rows
+    os.replace(cache_path + ".part", cache_path)
+    return rows
+
+
+# A cached table, memory-mapped: columns are read straight from the page cache
+def load_table(cache_path):
+    return pa.ipc.open_stream(pa.memory_map(cache_path)).read_all()
+
+
+def _describe(drug1, drug2, *suffix):
+    return pc.binary_join_element_wise("Drug 1: ", drug1, " interacts with Drug 2: ", drug2, *suffix, "")
+
+
+def _open_csv(stream, columns, delimiter):
+    return pacsv.open_csv(
+        stream,
+        read_options=pacsv.ReadOptions(block_size=READ_BLOCK_SIZE),
+        parse_options=pacsv.ParseOptions(delimiter=delimiter, quote_char=False),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=list(columns), column_types=columns, null_values=["-", ""], strings_can_be_null=True,
+        ),
+    )
+
+
+# Human-human interactions from a BioGRID tab3 zip, one chunk at a time:
+# only the needed columns are parsed, and the organism filter and the
+# description strings are computed on whole columns
+def iter_biogrid_batches(zip_path):
+    with zipfile.ZipFile(zip_path) as archive:
+        member = next(name for name in archive.namelist() if name.endswith(".tab3.txt"))
+        with archive.open(member) as stream:
+            for batch in _open_csv(stream, BIOGRID_COLUMNS, "\t"):
+                batch = pa.Table.from_batches([batch])
+                symbol_a = batch.column("Official Symbol Interactor A")
+                symbol_b = batch.column("Official Symbol Interactor B")
+                keep = pc.and_kleene(
+                    pc.and_kleene(pc.is_valid(symbol_a), pc.is_valid(symbol_b)),
+                    pc.and_kleene(
+                        pc.equal(batch.column("Organism Name Interactor A"), "Homo sapiens"),
+                        pc.equal(batch.column("Organism Name Interactor B"), "Homo sapiens"),
+                    ),
+                )
+                batch = batch.filter(pc.fill_null(keep, False))
+                yield batch.append_column("interaction", _describe(
+                    batch.column("Official Symbol Interactor A"), batch.column("Official Symbol Interactor B"),
+                ))
+
+
+def build_biogrid(zip_path, cache_path=None):
+    cache_path = cache_path or os.path.join(TRAINING_DATA_DIR, "biogrid.arrow")
+    stamp = _source_stamp(zip_path)
+    if not _is_fresh(cache_path, stamp):
+        schema = pa.schema(list(BIOGRID_COLUMNS.items()) + [("interaction", pa.string())])
+        _write_batches(iter_biogrid_batches(zip_path), schema, cache_path, stamp)
+    return cache_path
+
+
+def _with_ddi_description(table):
+    return table.append_column("interaction_description", _describe(
+        table.column("Drug1"), table.column("Drug2"), " -> Interaction: ", pc.cast(table.column("Y"), pa.string()),
+    ))
+
+
+# DrugBank DDI rows from a CSV with the TDC columns, streamed in chunks
+def iter_ddi_csv_batches(path):
+    with open(path, "rb") as stream:
+        for batch in _open_csv(stream, DDI_COLUMNS, ","):
+            yield _with_ddi_description(pa.Table.from_batches([batch]))
+
+
+def _ddi_schema():
+    return pa.schema(list(DDI_COLUMNS.items()) + [("interaction_description", pa.string())])
+
+
+def build_ddi_csv(path, cache_path=None):
+    cache_path = cache_path or os.path.join(TRAINING_DATA_DIR, "ddi.arrow")
+    stamp = _source_stamp(path)
+    if not _is_fresh(cache_path, stamp):
+        _write_batches(iter_ddi_csv_batches(path), _ddi_schema(), cache_path, stamp)
+    return cache_path
+
+
+# TDC's DrugBank DDI splits, one cache file per split. TDC hands back whole
+# frames, so there is nothing to stream; the descriptions are still built
+# column-wise and later stages read the caches instead of going through TDC.
+def build_ddi_tdc(cache_dir=None):
+    from tdc.multi_pred import DDI
+
+    cache_dir = cache_dir or TRAINING_DATA_DIR
+    paths = {}
+    for split, frame in DDI(name="DrugBank").get_split().items():
+        table = pa.Table.from_pandas(frame[list(DDI_COLUMNS)], preserve_index=False)
+        paths[split] = os.path.join(cache_dir, f"ddi_{split}.arrow")
+        _write_batches([_with_ddi_description(table)], _ddi_schema(), paths[split], f"{INGEST_VERSION}:tdc")
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest training data into memory-mappable Arrow caches.")
+    subparsers = parser.add_subparsers(dest="source", required=True)
+    biogrid = subparsers.add_parser("biogrid", help="Human interactions from a BioGRID tab3 release")
+    biogrid.add_argument("--zip", default=os.path.join("data", "biogrid.tab3.zip"), help="Release archive (downloaded if missing)")
+    biogrid.add_argument("--url", default=BIOGRID_URL)
+    biogrid.add_argument("--output", help="Cache file (default: <DDI_TRAINING_DATA_DIR>/biogrid.arrow)")
+    ddi = subparsers.add_parser("ddi", help="DrugBank drug-drug interactions")
+    ddi.add_argument("--input", help="CSV with the TDC columns (default: download via TDC, one cache per split)")
+    ddi.add_argument("--output", help="Cache file for --input (default: <DDI_TRAINING_DATA_DIR>/ddi.arrow)")
+    args = parser.parse_args()
+
+    if args.source == "biogrid":
+        paths = [build_biogrid(download(args.url, args.zip), args.output)]
+    elif args.input:
+        paths = [build_ddi_csv(args.input, args.output)]
+    else:
+        paths = list(build_ddi_tdc().values())
+    for path in paths:
+        print(f"{path}: {load_table(path).num_rows} rows")
+
+
+if __name__ == "__main__":
+    main()